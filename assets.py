@@ -0,0 +1,80 @@
+"""Load all the assets in a thread pool, while the menu is shown.
+
+Assets are still loaded through the cached functions of locals.py, so
+one requested before the loader got to it is just loaded right away,
+like before, and the loader then finds it in the cache.
+
+The workers only read files. Converting images to the format of the
+display is done by update(), on the main thread, which owns the display."""
+
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+import levels
+from locals import Color, Config, Files, get_atlas, get_font, get_img, get_sound, sprites
+from timeline import timeline
+
+# Design sizes of all the texts of the game. The title of the menu pulses.
+FONT_SIZES = (16, 24, 32, 50, 60, 64, 80, *range(81, 100))
+MODULES = ('states.game', 'states.statistics')  # States the menu imports lazily
+DIGITS = '0123456789'
+# Glyphs of the texts that change during the game: size, color, chars
+GLYPHS = (
+    (32, Color.BRIGHTEST, 'Score: Level' + DIGITS),
+    (32, Color.ORANGE, '<3'),
+    (32, Color.GOLD, '+' + DIGITS),
+    (24, Color.GOLD, '+' + DIGITS),
+)
+
+
+def load_fonts():
+    # In one task, as SDL_ttf cannot open several fonts at the same time
+    for size in sorted({Config().iscale(size) for size in FONT_SIZES}):
+        get_font(size)
+
+
+class AssetLoader:
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.futures = []
+        self.finished = False
+
+    def tasks(self):
+        for module in MODULES:
+            yield import_module, module
+        yield get_img, Files.SPRITE_SHEET
+        yield levels.builtin,
+        yield load_fonts,
+        for sound in Files.SOUNDS.glob('*.wav'):
+            yield get_sound, sound.stem
+
+    def start(self):
+        """Start loading everything in the background, if not already started."""
+        if self.futures:
+            return
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='assets')
+        self.futures = [executor.submit(*task) for task in self.tasks()]
+        executor.shutdown(wait=False)
+
+    @property
+    def done(self):
+        if self.futures and all(f.done() for f in self.futures):
+            # Errors are raised in the main thread, not lost in the pool
+            for future in self.futures:
+                future.result()
+            return True
+        return False
+
+    def update(self):
+        """Convert what was loaded for the display, once everything is. Only on the main thread."""
+        if self.finished or not self.done:
+            return
+        self.finished = True
+        sprites.prepare()
+        for size, color, chars in GLYPHS:
+            get_atlas(Config().iscale(size), color).warm(chars)
+        timeline.mark('assets loaded')
+        timeline.report()
+
+
+assets = AssetLoader()
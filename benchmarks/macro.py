@@ -0,0 +1,255 @@
+"""Replay whole game sessions without a window and time every frame.
+
+Each scene is a scripted, seeded session played by the autopilot, or a
+session recorded with `violet.py --record`. Every scene runs in its own
+process, so that its peak memory is its own. The results can be saved as
+JSON and compared to a baseline:
+
+    python -m benchmarks.macro --compare benchmarks/baseline.json
+
+The timings depend on the machine, so the baseline should be regenerated
+with --save-baseline when it changes."""
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import json
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pygame
+
+from core import App
+from headless import Autopilot
+from locals import Config
+from objects import BombBrick, Bricks
+from particles import budget
+from powerups import auto_ball_spawn, enemy_fire, stronger_bricks, wind
+from replay import Input, Replay
+from states.game import GameState
+from states.menu import MenuState
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).parent.parent
+BASELINE = Path(__file__).parent / 'baseline.json'
+SEED = 0
+# Metrics compared to the baseline, and the smallest difference that counts
+COMPARED = {
+    'logic_ms': 0.05,
+    'draw_ms': 0.05,
+    'peak_objects': 0,
+    'peak_particles': 0,
+    'peak_rss_mb': 5,
+}
+PERCENTILES = (50, 95, 99)
+
+SCENES = {}
+
+
+def scene(ticks, autopilot=True):
+    def wrapper(make_state):
+        SCENES[make_state.__name__] = (make_state, ticks, autopilot)
+        return make_state
+
+    return wrapper
+
+
+@scene(ticks=60 * 30)
+def early_level():
+    return GameState()
+
+
+@scene(ticks=60 * 30)
+def bomb_heavy():
+    game = GameState()
+    Config().bricks_levels[BombBrick] += 60
+    game.bricks.alive = False
+    game.bricks = game.add(Bricks.load(0))
+    return game
+
+
+@scene(ticks=60 * 60)
+def late_game():
+    game = GameState()
+    for powerup in (wind, enemy_fire, enemy_fire, enemy_fire, stronger_bricks, auto_ball_spawn):
+        powerup.apply(game)
+    game.level = 6
+    Config().ball_speed += game.level * GameState.BALL_SPEED_GAIN
+    return game
+
+
+@scene(ticks=60 * 20, autopilot=False)
+def menu():
+    return MenuState()
+
+
+def distribution(durations):
+    ms = np.array(durations) * 1000
+    stats = {f'p{p}': float(np.percentile(ms, p)) for p in PERCENTILES}
+    stats['max'] = float(ms.max())
+    stats['mean'] = float(ms.mean())
+    return stats
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on linux, bytes on mac
+    return rss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+
+
+def measure(app, ticks, autopilot=None):
+    """Step and draw the app for up to ticks frames, and time each of them."""
+
+    logic = []
+    draw = []
+    peak_objects = 0
+    peak_particles = 0
+
+    app.running = True
+    app.state.on_resume()
+    while app.running and len(logic) < ticks:
+        app.events()
+        if autopilot is not None:
+            autopilot(app.state)
+
+        start = perf_counter()
+        done = app.logic(app.inputs.logic_steps(1))
+        app.inputs.end_frame(done, app.state)
+        middle = perf_counter()
+        if not app.running:
+            break
+        app.state.interpolation = 1
+        app.state.draw(app.display)
+        end = perf_counter()
+
+        logic.append(middle - start)
+        draw.append(end - middle)
+        peak_objects = max(peak_objects, len(app.state.objects))
+        peak_particles = max(peak_particles, int(budget.live))
+
+    app.inputs.close()
+    return {
+        'frames': len(logic),
+        'logic_ms': distribution(logic),
+        'draw_ms': distribution(draw),
+        'peak_objects': peak_objects,
+        'peak_particles': peak_particles,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_scene(name):
+    """Run one scene in this process. name is a scene or a replay file."""
+
+    pygame.init()
+    # The game prints a lot, which we don't want in the results
+    with redirect_stdout(sys.stderr):
+        if name in SCENES:
+            make_state, ticks, autopilot = SCENES[name]
+            app = App(make_state, size=App.SIZE, headless=True, inputs=Input(SEED))
+            return measure(app, ticks, Autopilot(SEED) if autopilot else None)
+
+        app = App(MenuState, headless=True, inputs=Replay(name))
+        return measure(app, float('inf'))
+
+
+def run_isolated(name):
+    """Run one scene in a new process, so that its peak memory is its own."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / 'result.json'
+        subprocess.run([sys.executable, '-m', 'benchmarks.macro', '--in-process',
+                        '--output', str(output), name], check=True, cwd=ROOT, stdout=subprocess.DEVNULL)
+        return json.loads(output.read_text())['scenes'][name]
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of regressions of results against the baseline."""
+
+    regressions = []
+    for name, base in baseline['scenes'].items():
+        if name not in results:
+            continue
+        for metric, slack in COMPARED.items():
+            old = base.get(metric)
+            new = results[name].get(metric)
+            if old is None or new is None:
+                continue
+            if isinstance(old, dict):
+                pairs = [(f'{metric}.p{p}', old[f'p{p}'], new[f'p{p}']) for p in PERCENTILES]
+            else:
+                pairs = [(metric, old, new)]
+            for label, old, new in pairs:
+                if new > old * (1 + tolerance) and new - old > slack:
+                    regressions.append(f"{name}: {label} went from {old:.3f} to {new:.3f}")
+    return regressions
+
+
+def report(results):
+    for name, r in results.items():
+        logic = r['logic_ms']
+        draw = r['draw_ms']
+        print(f"{name:>12}: {r['frames']} frames, "
+              f"logic p50/p95/p99/max {logic['p50']:.2f}/{logic['p95']:.2f}/{logic['p99']:.2f}/{logic['max']:.2f}ms, "
+              f"draw {draw['p50']:.2f}/{draw['p95']:.2f}/{draw['p99']:.2f}/{draw['max']:.2f}ms, "
+              f"peak {r['peak_objects']} objects, {r['peak_particles']} particles, "
+              f"{r['peak_rss_mb'] or 0:.0f}MB")
+
+
+def main():
+    parser = ArgumentParser(description="Time whole game sessions, to catch performance regressions.")
+    parser.add_argument('scenes', nargs='*', metavar='SCENE',
+                        help=f"Scenes to run, among {', '.join(SCENES)}, or replay files. All scenes by default.")
+    parser.add_argument('--output', metavar='FILE', help="Save the results as JSON.")
+    parser.add_argument('--compare', metavar='FILE', help="Baseline to compare the results to.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Slowdown over the baseline that counts as a regression, 0.25 is 25%%.")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Save the results to {BASELINE}.")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Run all scenes in this process. Peak memory is then shared.")
+    args = parser.parse_args()
+
+    names = args.scenes or list(SCENES)
+    run = run_scene if args.in_process else run_isolated
+    results = {name: run(name) for name in names}
+    data = {
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'numpy': np.__version__,
+        'scenes': results,
+    }
+
+    report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(data, indent=2))
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(data, indent=2))
+        print(f"Saved the baseline to {BASELINE}.")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("Regression:", line)
+        if regressions:
+            sys.exit(1)
+        print(f"No regression over {args.tolerance:.0%} compared to {args.compare}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Time the hot functions of the game on their own, without a display.
+
+    python -m benchmarks.micro [FILTER...] [--output results.json]
+
+Each benchmark is a setup function that returns the call to time. The
+results are the time of one call, in microseconds, the best and the
+median of a few repeats."""
+
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import json
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import Path
+from statistics import median
+from timeit import Timer
+
+import numpy as np
+import pygame
+
+from core import App, State
+from locals import Color, draw_text, get_text, weighted_choice
+from objects import BackgroundShape, Ball, Brick, Bricks, draw_diamond
+from physics import circle_rect_normals
+from powerups import KINDS, random_powerup
+from replay import Input
+from states.game import GameState
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def wrapper(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return wrapper
+
+
+def collision(offset):
+    ball = Ball((400, 300))
+    rect = pygame.Rect(0, 0, 50, 20)
+    rect.center = ball.rect.center + pygame.Vector2(offset)
+    cx, cy = (np.array([v], float) for v in ball.rect.center)
+    radius = np.array([ball.size.x / 2])
+    return lambda: circle_rect_normals(cx, cy, radius, rect.left, rect.top, rect.right, rect.bottom)
+
+
+@benchmark('circle_rect_normals.separating')
+def _():
+    return collision((100, 0))
+
+
+@benchmark('circle_rect_normals.overlapping')
+def _():
+    return collision((0, 18))
+
+
+@benchmark('circle_rect_normals.center_inside')
+def _():
+    return collision((3, 2))
+
+
+@benchmark('Bricks.build')
+def _():
+    # Not Bricks.load(), that takes the level prebuilt in the background
+    return lambda: Bricks.build(0)
+
+
+@benchmark('Bricks.all_bricks')
+def _():
+    bricks = Bricks.load(0)
+    return lambda: list(bricks.all_bricks())
+
+
+@benchmark('weighted_choice')
+def _():
+    items = [(kind, kind.proba) for kind in KINDS]
+    return lambda: weighted_choice(items, 2)
+
+
+@benchmark('random_powerup')
+def _():
+    game = GameState()
+    return lambda: random_powerup(3, game=game)
+
+
+@benchmark('get_text.hit')
+def _():
+    get_text("Score: 42", Color.BRIGHTEST, 32)
+    return lambda: get_text("Score: 42", Color.BRIGHTEST, 32)
+
+
+@benchmark('get_text.miss')
+def _():
+    def miss():
+        get_text.cache_clear()
+        get_text("Score: 42", Color.BRIGHTEST, 32)
+
+    return miss
+
+
+@benchmark('draw_text')
+def _():
+    display = App.CURRENT_APP.display
+    return lambda: draw_text(display, "Score: 42", None, 32, topright=(795, 3))
+
+
+@benchmark('draw_text.changing')
+def _():
+    display = App.CURRENT_APP.display
+    scores = iter(range(10 ** 9))
+    return lambda: draw_text(display, f"Score: {next(scores)}", None, 32, topright=(795, 3))
+
+
+@benchmark('Brick.draw')
+def _():
+    display = App.CURRENT_APP.display
+    brick = next(Bricks.load(0).all_bricks())
+    return lambda: brick.draw(display)
+
+
+@benchmark('Brick.render')
+def _():
+    display = App.CURRENT_APP.display
+    rect = pygame.Rect(100, 100, 53, 32)
+    return lambda: Brick.render(display, rect, 2)
+
+
+@benchmark('draw_diamond')
+def _():
+    display = App.CURRENT_APP.display
+    pos = pygame.Vector2(400, 300)
+    vel = pygame.Vector2(3, -2)
+    return lambda: draw_diamond(display, pos, vel, 4, Color.ORANGE)
+
+
+def state_draw(nb):
+    state = State()
+    for _ in range(nb):
+        state.add(BackgroundShape.random())
+    state.logic()
+    display = App.CURRENT_APP.display
+    return lambda: state.draw(display)
+
+
+for nb in (10, 100, 1000):
+    benchmark(f'State.draw.{nb}_objects')(lambda nb=nb: state_draw(nb))
+
+
+def run(setup, repeat):
+    """Time the call returned by setup. Return its best and median time in µs."""
+    call = setup()
+    timer = Timer(call)
+    number, _ = timer.autorange()
+    times = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return {'number': number, 'best_us': min(times), 'median_us': median(times)}
+
+
+def main():
+    parser = ArgumentParser(description="Time the hot functions of the game.")
+    parser.add_argument('filters', nargs='*', metavar='FILTER',
+                        help="Only run the benchmarks whose name contains one of these.")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of timings of each benchmark.")
+    parser.add_argument('--output', metavar='FILE', help="Save the results as JSON.")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit.")
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return
+
+    pygame.init()
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filters and not any(f in name for f in args.filters):
+            continue
+        # Some functions print, which we don't want in the output
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            App(State, size=App.SIZE, headless=True, inputs=Input(0))
+            results[name] = result = run(setup, args.repeat)
+        print(f"{name:>30}: {result['best_us']:10.2f}µs best, {result['median_us']:10.2f}µs median",
+              file=sys.stderr)
+
+    data = {
+        'python': sys.version.split()[0],
+        'pygame': pygame.version.ver,
+        'benchmarks': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(data, indent=2))
+    else:
+        print(json.dumps(data, indent=2))
+
+
+if __name__ == '__main__':
+    main()
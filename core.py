@@ -1,24 +1,54 @@
 from functools import lru_cache
 from operator import attrgetter
+from math import sqrt
 from random import randint
-from time import time
+from time import perf_counter, time
+from typing import Dict, Iterator, List, Optional, Type, TypeVar
 
 import pygame
 
-from locals import Color, Config, DEBUG, draw_text, Files, Settings, vec2int, VOLUME
+from locals import clamp, Color, Config, DEBUG, draw_text, Files, Settings, sprites, vec2int, VOLUME
+from profiler import profiler
+from replay import Input
+from timeline import timeline
 
 
 class Object:
     Z = 0
+    MAX_INTERPOLATION = 100  # Bigger jumps are teleports, and are not smoothed
+    STATIC = False  # Static objects report what changed instead of being redrawn every frame
+
     def __init__(self, pos, size):
         self.pos = pygame.Vector2(pos)
+        self.prev_pos = pygame.Vector2(pos)
         self.size = pygame.Vector2(size)
-        self.alive = True
+        self.store = None  # type: Optional[EntityStore]
+        self._alive = True
+
+    @property
+    def alive(self):
+        return self._alive
+
+    @alive.setter
+    def alive(self, value):
+        # Tell the store, so it can remove the dead without looking at everyone
+        if self._alive and not value and self.store is not None:
+            self.store.dead.append(self)
+        self._alive = value
 
     @property
     def rect(self):
         return pygame.Rect(self.pos, self.size)
 
+    @property
+    def draw_rect(self):
+        """The area of the screen covered by draw()."""
+        return self.rect.inflate(2, 2)
+
+    def changed_rects(self):
+        """Areas that changed since the last draw, for STATIC objects."""
+        return []
+
     def handle_event(self, event):
         if event.type == pygame.MOUSEMOTION:
             self.handle_mouse_event(event)
@@ -38,6 +68,24 @@ class Object:
         if DEBUG:
             pygame.draw.rect(display, 'red', (self.pos, self.size), 1)
 
+    def interpolated(self, alpha, func, *args):
+        """Call func with the object between its last two logic positions.
+
+        alpha is the fraction of a logic tick elapsed since the last one."""
+
+        pos = self.pos
+        if alpha >= 1 or pos.distance_squared_to(self.prev_pos) > self.MAX_INTERPOLATION ** 2:
+            return func(*args)
+
+        self.pos = self.prev_pos.lerp(pos, alpha)
+        try:
+            return func(*args)
+        finally:
+            self.pos = pos
+
+    def draw_interpolated(self, display: pygame.Surface, alpha):
+        self.interpolated(alpha, self.draw, display)
+
     def on_death(self, game):
         pass
 
@@ -47,16 +95,133 @@ class Object:
         self.pos *= ratio
 
 
+T = TypeVar('T', bound=Object)
+
+
+class EntityStore:
+    """All the objects of a state, indexed by class and by layer.
+
+    Objects added while the store is locked (during the logic) are queued
+    and inserted in batch by flush(). Dead objects report themselves,
+    so cleaning them costs only the number of deaths."""
+
+    def __init__(self):
+        self.objects = {}  # type: Dict[Object, None]  # Insertion ordered set
+        self.by_type = {}  # type: Dict[type, Dict[Object, None]]  # Exact class -> objects
+        self.layers = {}  # type: Dict[int, Dict[Object, None]]  # Z -> objects to draw
+        self.z_order = []  # Z of all layers, sorted
+        self.pending = []  # type: List[Object]
+        self.dead = []  # type: List[Object]
+        self.locked = False
+        self._subclasses = {}  # type -> exact classes in the store that are subclasses
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __contains__(self, object):
+        return object in self.objects
+
+    def add(self, object):
+        if self.locked:
+            self.pending.append(object)
+        else:
+            self.insert(object)
+        return object
+
+    def insert(self, object):
+        object.store = self
+        self.objects[object] = None
+
+        try:
+            self.by_type[type(object)][object] = None
+        except KeyError:
+            self.by_type[type(object)] = {object: None}
+            self._subclasses.clear()
+
+        try:
+            self.layers[object.Z][object] = None
+        except KeyError:
+            self.layers[object.Z] = {object: None}
+            self.z_order = sorted(self.layers)
+
+        if not object.alive:
+            self.dead.append(object)
+
+    def flush(self):
+        """Insert all the objects queued while the store was locked."""
+        pending = self.pending
+        self.pending = []
+        for object in pending:
+            self.insert(object)
+
+    def classes(self, type_):
+        try:
+            return self._subclasses[type_]
+        except KeyError:
+            classes = self._subclasses[type_] = [t for t in self.by_type if issubclass(t, type_)]
+            return classes
+
+    def get_all(self, type_):
+        # type: (Type[T]) -> Iterator[T]
+        for t in self.classes(type_):
+            yield from self.by_type[t]
+
+    def count(self, type_):
+        return sum(len(self.by_type[t]) for t in self.classes(type_))
+
+    def counts(self):
+        """Number of objects of each exact class, by name."""
+        return {t.__name__: len(objects) for t, objects in self.by_type.items() if objects}
+
+    def remove_dead(self, state):
+        """Call on_death on every object that died, then forget them."""
+        dead = self.dead
+        self.dead = []
+        for object in dead:
+            object.on_death(state)
+        for object in dead:
+            if object in self.objects:
+                del self.objects[object]
+                del self.by_type[type(object)][object]
+                del self.layers[object.Z][object]
+                object.store = None
+
+
+def merge_rects(rects, bounds):
+    """Clip the rects to the bounds and merge the ones that overlap."""
+    merged = []
+    for rect in rects:
+        rect = rect.clip(bounds)
+        if not rect:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
 class State:
     BG_COLOR = Color.DARKEST
     BG_MUSIC = None
+    DIRTY_RECTS = False  # Whether the state can be drawn with only the parts that changed
 
     def __init__(self):
-        self.add_later = []
-        self.add_lock = False
-        self.objects = set()
+        self.objects = EntityStore()
+        self._particles = None
         self.next_state = self
         self.shake = 0
+        self.interpolation = 1  # Set by the App before each draw
+
+        # Dirty rects rendering
+        self.full_redraw = True
+        self.dirty_areas = []  # Extra areas to redraw this frame, like text
+        self.last_areas = {}  # Object -> area it covered on the last frame
+        self.updated_rects = None  # What changed in the last draw, None for everything
 
     @property
     def size(self):
@@ -71,16 +236,23 @@ class State:
         return Config().h
 
     def add(self, object):
-        if self.add_lock:
-            self.add_later.append(object)
-        else:
-            self.objects.add(object)
-        return object
+        return self.objects.add(object)
 
     def get_all(self, type_):
-        for object in self.objects:
-            if isinstance(object, type_):
-                yield object
+        # type: (Type[T]) -> Iterator[T]
+        return self.objects.get_all(type_)
+
+    def count(self, type_):
+        """Number of objects of the given type, subclasses included."""
+        return self.objects.count(type_)
+
+    @property
+    def particles(self):
+        """The particle system of the state, created on first use."""
+        if self._particles is None:
+            from particles import ParticleSystem
+            self._particles = self.add(ParticleSystem())
+        return self._particles
 
     def logic(self):
         """All the logic of the state happens here.
@@ -88,37 +260,106 @@ class State:
         To change to an other state, you need to set self.next_state"""
 
         # Add all object that have been queued
-        self.add_lock = False
-        for object in self.add_later:
-            self.add(object)
-        self.add_later = []
-        self.add_lock = True
+        self.objects.locked = False
+        self.objects.flush()
+        self.objects.locked = True
+
+        # Remember where everything was, for interpolation.
+        # Before any logic, as some objects move others.
+        for object in self.objects:
+            object.prev_pos = pygame.Vector2(object.pos)
 
         # Logic for all objects
+        timed = profiler.enabled
         for object in self.objects:
+            if timed:
+                start = perf_counter()
             object.logic(self)
+            if timed:
+                profiler.add('logic', object, perf_counter() - start)
 
         # Clean dead objects
-        to_remove = set()
-        for object in self.objects:
-            if not object.alive:
-                to_remove.add(object)
-                object.on_death(self)
-        self.objects.difference_update(to_remove)
+        self.objects.remove_dead(self)
 
     def draw(self, display: pygame.Surface):
-        if self.BG_COLOR:
-            display.fill(self.BG_COLOR)
-
-        for z in sorted(set(o.Z for o in self.objects)):
-            for obj in self.objects:
-                if z == obj.Z:
-                    obj.draw(display)
+        app = App.CURRENT_APP
+        dirty_mode = app is not None and app.dirty_rects and app.state is self and self.DIRTY_RECTS
+        if dirty_mode and not self.full_redraw and not self.shake:
+            self.draw_dirty(display)
+        else:
+            self.draw_all(display, track=dirty_mode)
+        self.full_redraw = False
+        self.dirty_areas = []
 
         if self.shake:
             s = 3
             display.scroll(randint(-s, s), randint(-s, s))
             self.shake -= 1
+            # Everything moved, the next frame can not reuse this one
+            self.full_redraw = True
+            self.updated_rects = None
+
+    def draw_all(self, display, track=False):
+        """Draw everything. If track, remember where objects were for the next dirty draw."""
+
+        if self.BG_COLOR:
+            display.fill(self.BG_COLOR)
+
+        areas = {}
+        for z in self.objects.z_order:
+            for obj in self.objects.layers[z]:
+                if track:
+                    areas[obj] = obj.interpolated(self.interpolation, getattr, obj, 'draw_rect')
+                self.draw_object(display, obj)
+
+        self.last_areas = areas
+        self.updated_rects = None
+
+    def draw_dirty(self, display):
+        """Redraw only the parts of the screen where something changed."""
+
+        last = self.last_areas
+        areas = {}
+        rects = list(self.dirty_areas)
+        for z in self.objects.z_order:
+            for obj in self.objects.layers[z]:
+                area = obj.interpolated(self.interpolation, getattr, obj, 'draw_rect')
+                old = last.pop(obj, None)
+                if obj.STATIC and old == area:
+                    rects.extend(obj.changed_rects())
+                else:
+                    rects.append(area)
+                    if old is not None:
+                        rects.append(old)
+                areas[obj] = area
+        # Objects that disappeared since the last frame
+        rects.extend(last.values())
+        self.last_areas = areas
+
+        dirty = merge_rects(rects, display.get_rect())
+        if self.BG_COLOR:
+            for rect in dirty:
+                display.fill(self.BG_COLOR, rect)
+
+        # Objects are drawn entirely, but the parts outside the dirty rects
+        # did not change so drawing them again gives the same pixels.
+        for obj, area in areas.items():
+            if area.collidelist(dirty) != -1:
+                self.draw_object(display, obj)
+
+        self.updated_rects = dirty
+
+    def draw_object(self, display, obj):
+        timed = profiler.enabled
+        if timed:
+            start = perf_counter()
+        obj.draw_interpolated(display, self.interpolation)
+        if timed:
+            profiler.add('draw', obj, perf_counter() - start)
+
+    def mark_dirty(self, rect):
+        """Redraw this area on the next draw, in dirty rects mode."""
+        self.dirty_areas.append(pygame.Rect(rect))
 
     def handle_event(self, event):
         if event.type == pygame.KEYDOWN:
@@ -155,7 +396,8 @@ class State:
 
     def on_resume(self):
         self.next_state = self
-        if self.BG_MUSIC:
+        self.full_redraw = True
+        if self.BG_MUSIC and not (App.CURRENT_APP and App.CURRENT_APP.headless):
             pygame.mixer.music.load(Files.SOUNDS / self.BG_MUSIC)
             pygame.mixer.music.set_volume(VOLUME['BG_MUSIC'] * Settings().music)
             pygame.mixer.music.play(-1)
@@ -166,23 +408,59 @@ class State:
     def resize(self, old, new):
         for obj in self.objects:
             obj.resize(old, new)
+            obj.prev_pos = pygame.Vector2(obj.pos)
+        self.full_redraw = True
+
+
+class FrameStats:
+    """Running statistics on the duration of frames, to measure pacing."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.worst = 0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.total_sq += duration ** 2
+        self.worst = max(self.worst, duration)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def jitter(self):
+        """Standard deviation of the frame durations."""
+        if not self.count:
+            return 0
+        return sqrt(max(0, self.total_sq / self.count - self.mean ** 2))
 
 
 class App:
-    FPS = 60
+    FPS = 60  # Maximum rendering rate, 0 to not limit it
+    LOGIC_FPS = 60  # Rate of the simulation, independent of the rendering
+    MAX_LOGIC_STEPS = 5  # Maximum number of logic ticks to catch up in one frame
+    FIXED_TIMESTEP = True
+    DIRTY_RECTS = False  # Only update the parts of the screen that changed
     CURRENT_APP = None
     NAME = "Not a Brick Breaker"
     SIZE = pygame.Vector2(800, 500)  # Design size
     BORDER_COLOR = 'black'
 
-    def __init__(self, initial_state):
+    def __init__(self, initial_state, size=None, headless=False, inputs=None):
         self.running = False
         self.clock = pygame.time.Clock()
-
+        self.headless = headless
+        self.dirty_rects = self.DIRTY_RECTS
+        self.full_refresh = True  # Update the whole window on the next frame
 
         App.CURRENT_APP = self
+        self.inputs = inputs or Input()
 
-        self.real_size = pygame.Vector2(pygame.display.list_modes()[0])
+        self.real_size = pygame.Vector2(self.inputs.size or size or self.desktop_size())
         self.view_port: pygame.Rect = None
         self.display: pygame.Surface = None
         self.real_display: pygame.Surface = None
@@ -190,8 +468,19 @@ class App:
         # Open the window
         self.set_display()
         pygame.display.set_caption(self.NAME)
+        timeline.mark('display')
 
+        self.inputs.begin(self)
         self.state = initial_state()
+        timeline.mark('first state')
+
+    @staticmethod
+    def desktop_size():
+        # get_desktop_sizes() is instant, list_modes() can probe the driver for a while
+        try:
+            return pygame.display.get_desktop_sizes()[0]
+        except (AttributeError, IndexError, pygame.error):  # pygame < 2.0.0
+            return pygame.display.list_modes()[0]
 
     @property
     def scale(self):
@@ -210,42 +499,149 @@ class App:
 
         self.view_port = rect
         self.display = self.real_display.subsurface(rect)
+        self.full_refresh = True
 
         Config().size = pygame.Vector2(self.view_port.size)
+        if sprites.sheet is not None:
+            # Otherwise they are prepared once the assets are loaded
+            sprites.prepare()
 
     def run(self):
         frame = 0
+        ticks = 0
         start = time()
+        pacing = FrameStats()
+        dt = 1 / self.LOGIC_FPS
+        lag = 0
+        last = perf_counter()
+
         self.running = True
         self.state.on_resume()
         while self.running:
+            now = perf_counter()
+            if frame:
+                pacing.add(now - last)
+            lag += now - last
+            last = now
+
+            profiler.start_frame()
             self.events()
-            self.state.logic()
+            profiler.lap('events')
+
+            if self.FIXED_TIMESTEP:
+                steps = self.inputs.logic_steps(min(int(lag / dt), self.MAX_LOGIC_STEPS))
+                # When we are too slow to keep up, the game slows down instead
+                # of spiraling into ever more logic steps per frame.
+                lag = clamp(lag - steps * dt, 0, dt)
+            else:
+                steps = self.inputs.logic_steps(1)
+            done = self.logic(steps)
+            ticks += done
+            self.inputs.end_frame(done, self.state)
+            profiler.lap('logic')
+
+            if not self.running:
+                break
+
+            self.state.interpolation = lag / dt if self.FIXED_TIMESTEP else 1
+            if profiler.overlay:
+                self.state.full_redraw = True
             self.state.draw(self.display)
-
-            pygame.display.update()
+            profiler.lap('draw')
+            profiler.draw(self.display)
+            profiler.lap('overlay')
+
+            self.update_display()
+            profiler.lap('update')
+            profiler.end_frame(self.state)
+            if not frame:
+                timeline.mark('first frame')
+                timeline.report()
             self.clock.tick(self.FPS)
             frame += 1
-            if self.state != self.state.next_state:
-                self.state.on_exit()
-                self.state = self.state.next_state
-                if self.state is None:
-                    self.running = False
-                else:
-                    self.state.on_resume()
 
         duration = time() - start
-        print(f"Game played for {duration:.2f} seconds, at {frame / duration:.1f} FPS.")
+        print(f"Game played for {duration:.2f} seconds, at {frame / duration:.1f} FPS "
+              f"and {ticks / duration:.1f} logic ticks per second.")
+        print(f"Frame time: {pacing.mean * 1000:.2f}ms, jitter: {pacing.jitter * 1000:.2f}ms, "
+              f"worst: {pacing.worst * 1000:.2f}ms.")
         Settings().minutes_played += duration / 60
         Settings().save()
+        profiler.save()
+        self.inputs.close()
+
+    def logic(self, steps):
+        """Run up to steps logic ticks, less if the app stops. Return how many ran."""
+        done = 0
+        while self.running and done < steps:
+            self.state.logic()
+            self.update_state()
+            done += 1
+        return done
+
+    def run_headless(self, frames, render_every=0, autopilot=None):
+        """Step the logic as fast as possible, without any throttling.
+
+        The state is drawn only every render_every ticks, and never if it is 0.
+        The display is never updated. Returns the number of ticks per second."""
+
+        ticks = 0
+        start = perf_counter()
+        self.running = True
+        self.state.on_resume()
+        while self.running and ticks < frames:
+            profiler.start_frame()
+            self.events()
+            if autopilot is not None:
+                autopilot(self.state)
+            profiler.lap('events')
+            done = self.logic(self.inputs.logic_steps(1))
+            ticks += done
+            self.inputs.end_frame(done, self.state)
+            profiler.lap('logic')
+
+            if render_every and ticks % render_every == 0 and self.running:
+                self.state.interpolation = 1
+                self.state.draw(self.display)
+                profiler.lap('draw')
+            profiler.end_frame(self.state)
+
+        duration = perf_counter() - start
+        tps = ticks / duration
+        print(f"Simulated {ticks} ticks in {duration:.2f} seconds, at {tps:.1f} ticks per second.")
+        profiler.save()
+        self.inputs.close()
+        return tps
+
+    def update_display(self):
+        rects = self.state.updated_rects
+        if self.full_refresh or rects is None or profiler.overlay:
+            pygame.display.update()
+        else:
+            # The display is a subsurface of the window, inside the borders
+            pygame.display.update([r.move(self.view_port.topleft) for r in rects])
+        self.full_refresh = False
+
+    def update_state(self):
+        """Switch to the next state if the current one asked for it."""
+        if self.state != self.state.next_state:
+            self.state.on_exit()
+            self.state = self.state.next_state
+            if self.state is None:
+                self.running = False
+            else:
+                self.state.on_resume()
+            self.full_refresh = True
 
     def events(self):
-        for event in pygame.event.get():
+        for event in self.inputs.poll():
             if event.type == pygame.QUIT:
                 self.running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     self.running = False
+                elif event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
             elif event.type == pygame.VIDEORESIZE:
                 old = Config().size
                 self.set_display(event.size)
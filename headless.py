@@ -0,0 +1,68 @@
+"""Run the game without a window, as fast as the CPU allows.
+
+This is used for soak testing and to measure the throughput of the logic
+on machines without a display. SDL must be set to its dummy drivers before
+pygame is initialised, which is done by violet.py with --headless."""
+
+from functools import partial
+from random import Random
+
+from core import App
+from locals import clamp, rng
+from objects import Ball
+from states.game import GameState
+from states.gameover import GameOverState
+from states.pause import PauseState
+from states.pickpowerup import PickPowerUpState
+
+
+class Autopilot:
+    """Plays well enough to keep the game going without any input."""
+
+    def __init__(self, seed=None):
+        self.aim = 0
+        # Separate from the session randomness, like a player would be
+        self.random = Random(seed)
+
+    def __call__(self, state):
+        if isinstance(state, GameState):
+            self.play(state)
+        elif isinstance(state, PickPowerUpState):
+            if state.next_state is state:
+                state.validate()
+        elif isinstance(state, PauseState):
+            state.next_state = state.paused
+        elif isinstance(state, GameOverState):
+            state.next_state = GameState()
+
+    def play(self, game):
+        bar = game.bar
+        balls = [ball for ball in game.get_all(Ball) if ball.vel.y > 0]
+        if not balls:
+            return
+
+        lowest = max(balls, key=lambda b: b.pos.y)
+        # Don't always hit with the center, so the ball goes everywhere
+        if lowest.pos.y < game.h / 2:
+            self.aim = self.random.uniform(-0.6, 0.6)
+
+        goal = lowest.rect.centerx - bar.size.x / 2 * (1 + self.aim)
+        bar.mouse_goal = clamp(goal, 0, game.w - bar.size.x)
+
+
+class BallStorm(GameState):
+    """A game that starts with hundreds of balls, to stress the ball physics."""
+
+    def __init__(self, balls=300):
+        super().__init__()
+        for _ in range(balls):
+            center = (rng.uniform(0, self.w), rng.uniform(self.h / 2, self.h - 50))
+            self.add(Ball(center, rng.uniform(-170, -10)))
+
+
+def run_headless(frames, render_every=0, autopilot=True, initial_state=GameState, balls=0, inputs=None):
+    if balls:
+        initial_state = partial(BallStorm, balls)
+
+    app = App(initial_state, size=App.SIZE, headless=True, inputs=inputs)
+    return app.run_headless(frames, render_every, Autopilot() if autopilot else None)
@@ -0,0 +1,119 @@
+"""Binary level packs, that can hold thousands of levels of any size.
+
+A pack is memory-mapped, so opening one does not read it, and loading a
+level only reads the bytes of this level. It is made of:
+ - a header with the number of levels and a digest of what the pack was
+   made from, if anything,
+ - an index with the offset and size of each level,
+ - for each level, the kind of brick of each cell, line by line, then
+   the extra life of each cell: the hits it takes on top of the usual.
+
+    python levelpack.py OUTPUT IMAGE [IMAGE...]
+
+converts images like assets/levels.png to a pack."""
+
+import mmap
+import struct
+from argparse import ArgumentParser
+from collections import namedtuple
+from pathlib import Path
+
+import pygame
+
+MAGIC = b'VLP1'
+HEADER = struct.Struct('<4sI20s')  # magic, number of levels, digest of the source
+ENTRY = struct.Struct('<QHH')  # offset of the level, lines, columns
+MAX_SIZE = 255  # Most lines or columns of a level
+
+Level = namedtuple('Level', 'lines cols kinds lives')
+
+
+class LevelPack:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is not a level pack.")
+        magic, self.count, self.source = HEADER.unpack_from(self.data)
+        if magic != MAGIC or len(self.data) < HEADER.size + self.count * ENTRY.size:
+            raise ValueError(f"{path} is not a level pack.")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError(f"{self.path} has no level {idx}.")
+
+        offset, lines, cols = ENTRY.unpack_from(self.data, HEADER.size + idx * ENTRY.size)
+        cells = lines * cols
+        if offset + 2 * cells > len(self.data):
+            raise ValueError(f"Level {idx} of {self.path} is cut.")
+        return Level(lines, cols, self.data[offset:offset + cells], self.data[offset + cells:offset + 2 * cells])
+
+    def close(self):
+        self.data.close()
+
+
+def encode(levels, source=b''):
+    """The bytes of a pack with the given levels."""
+
+    header = HEADER.pack(MAGIC, len(levels), source)
+    offset = HEADER.size + len(levels) * ENTRY.size
+    index = []
+    for level in levels:
+        if not (0 < level.lines <= MAX_SIZE and 0 < level.cols <= MAX_SIZE):
+            raise ValueError(f"Levels are at most {MAX_SIZE}x{MAX_SIZE}, not {level.lines}x{level.cols}.")
+        if not len(level.kinds) == len(level.lives) == level.lines * level.cols:
+            raise ValueError(f"A {level.lines}x{level.cols} level needs a kind and a life per cell.")
+        index.append(ENTRY.pack(offset, level.lines, level.cols))
+        offset += 2 * level.lines * level.cols
+
+    return b''.join([header, *index, *(level.kinds + level.lives for level in levels)])
+
+
+def write(path, levels, source=b''):
+    # Renamed at the end, so that a game running at the same time never sees half a pack
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(encode(levels, source))
+    tmp.replace(path)
+
+
+def from_image(image, tile=16, size=15):
+    """The levels of an image where each tile×tile square is a level,
+    and the palette index of each pixel is the kind of its brick."""
+
+    palette = image.get_palette()
+    # Some colors appear twice in the palette, the first one is the kind
+    kinds = bytes(palette.index(color) for color in palette) + bytes(256 - len(palette))
+    pixels = pygame.image.tostring(image, 'P').translate(kinds)
+
+    width = image.get_width()
+    levels = []
+    for y in range(0, image.get_height() - tile + 1, tile):
+        for x in range(0, width - tile + 1, tile):
+            starts = [(y + line) * width + x for line in range(size)]
+            grid = b''.join(pixels[start:start + size] for start in starts)
+            levels.append(Level(size, size, grid, bytes(len(grid))))
+    return levels
+
+
+def main():
+    parser = ArgumentParser(description="Make a level pack from images of levels.")
+    parser.add_argument('output', type=Path)
+    parser.add_argument('images', nargs='+', type=Path)
+    parser.add_argument('--tile', type=int, default=16, help="Size of a level in the images.")
+    parser.add_argument('--size', type=int, default=15, help="Number of lines and columns of a level.")
+    args = parser.parse_args()
+
+    levels = []
+    for path in args.images:
+        levels += from_image(pygame.image.load(path), args.tile, args.size)
+    write(args.output, levels)
+    print(f"Wrote {len(levels)} levels to {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
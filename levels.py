@@ -0,0 +1,113 @@
+"""The levels played, from a level pack, and prebuilt in the background.
+
+The levels of the game are drawn in levels.png, where each 16x16 tile is
+a level and the palette index of each pixel the kind of brick of a cell.
+Decoding it pixel by pixel is slow, so it is converted once to a level
+pack, levels.cache, and converted again only when levels.png changes.
+Another pack can be played instead with use().
+
+Levels are also built in a background thread while the game is played,
+so that loading the next level costs nothing at frame time."""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha1
+from threading import Lock
+
+import levelpack
+from locals import Config, Files, get_img
+
+CACHE = Files.ASSETS / 'levels.cache'
+TILE = 16  # Size of a level in levels.png
+SIZE = 15  # Number of lines and columns of bricks of a level in levels.png
+PLAYABLE = 13  # Levels of levels.png picked at random
+
+custom = None  # type: levelpack.LevelPack  # Pack played instead of levels.png
+_builtin_lock = Lock()
+
+
+def builtin():
+    """The levels of levels.png, from the cache if the image did not change."""
+    # The asset loader, the prebuilder and the game can ask for it at the same time,
+    # it must be converted and written only once
+    with _builtin_lock:
+        return _builtin()
+
+
+@lru_cache()
+def _builtin():
+    digest = sha1(Files.LEVELS.read_bytes()).digest()
+    try:
+        pack = levelpack.LevelPack(CACHE)
+        if pack.source == digest:
+            return pack
+        pack.close()
+    except (OSError, ValueError):
+        pass
+
+    levels = levelpack.from_image(get_img(Files.LEVELS), TILE, SIZE)
+    try:
+        levelpack.write(CACHE, levels, digest)
+        return levelpack.LevelPack(CACHE)
+    except OSError:
+        # Read only install, we will decode it each time
+        return levels
+
+
+def pack():
+    return custom if custom is not None else builtin()
+
+
+def use(path):
+    """Play the levels of the pack at path instead of levels.png."""
+    global custom
+    custom = levelpack.LevelPack(path)
+    prebuilt.levels.clear()
+
+
+def playable():
+    """Number of levels picked at random."""
+    return len(custom) if custom is not None else PLAYABLE
+
+
+class Prebuilt:
+    """Levels built in the background, waiting to be played.
+
+    A level is only used if the bricks would be the same if built now,
+    that is if the window size and the life of the bricks did not change.
+    Only the first levels are prebuilt, big packs would not fit in memory."""
+
+    MAX_LEVELS = 16
+
+    def __init__(self):
+        self.levels = {}  # level -> (key, Bricks)
+        self.executor = None
+
+    @staticmethod
+    def key():
+        config = Config()
+        return config.brick_life, tuple(config.size), id(pack())
+
+    def take(self, level, build):
+        """A prebuilt level if there is a valid one, otherwise build it now."""
+
+        key, bricks = self.levels.pop(level, (None, None))
+        if key != self.key():
+            bricks = build(level)
+
+        # Replace it and the levels that are not valid anymore
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(1, thread_name_prefix='levels')
+        self.executor.submit(self.refill, build)
+        return bricks
+
+    def refill(self, build):
+        for level in range(min(playable(), self.MAX_LEVELS)):
+            key = self.key()
+            if self.levels.get(level, (None,))[0] != key:
+                bricks = build(level)
+                if key == self.key():
+                    self.levels[level] = key, bricks
+
+
+prebuilt = Prebuilt()
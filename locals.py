@@ -1,8 +1,10 @@
 import json
 from collections import defaultdict
 from functools import lru_cache
+from math import log, log1p
 from pathlib import Path
-from random import gauss, random, uniform
+from random import Random, SystemRandom
+from threading import Lock
 
 import pygame
 import pygame.gfxdraw
@@ -14,6 +16,19 @@ VOLUME = {
     'hit': 1,
 }
 
+# All the randomness of the game comes from here, so a session can be
+# replayed exactly from its seed. Visual only effects that happen while
+# drawing must not use it, as the number of frames drawn varies.
+rng = Random()
+
+
+def seed(value=None):
+    """Seed the session randomness and return the seed, a new one if value is None."""
+    if value is None:
+        value = SystemRandom().getrandbits(32)
+    rng.seed(value)
+    return value
+
 
 def clamp(x, mini=0, maxi=1):
     if x < mini:
@@ -41,7 +56,7 @@ def weighted_choice(items, count=1):
         for (item, proba) in items:
             p += proba
             cum.append((item, p))
-        cut = uniform(0, p)
+        cut = rng.uniform(0, p)
         for i, (item, p) in enumerate(cum):
             if p > cut:
                 choice.append(item)
@@ -71,7 +86,7 @@ def rrange(x: float):
     base = int(x)
     probability = x - base
 
-    if random() < probability:
+    if rng.random() < probability:
         return range(base + 1)
     return range(base)
 
@@ -81,15 +96,74 @@ def get_img(path):
     return pygame.image.load(path)
 
 
-@lru_cache()
+class SpriteAtlas:
+    """The sprites of the sprite sheet, in the pixel format of the display, at the scales they are drawn.
+
+    prepare() converts the sheet and scales the sprites for the size of the
+    display each time it changes, so drawing never converts nor scales.
+    levels.png is not in it, it is never drawn and only its palette matters."""
+
+    TILE = 16
+    KEY = (255, 0, 255)  # Not in the sheet
+
+    def __init__(self):
+        self.sheet = None  # Loaded on first use, or by prepare()
+        self.sprites = {}  # (idx, scale) -> Surface
+        self.uses = []  # (indices, scale()) of the sprites drawn at a scale that depends on the display
+
+    def use(self, indices, scale):
+        """Have the sprites of indices ready at scale() for each size of the display."""
+        indices = list(indices)
+        self.uses.append((indices, scale))
+        if self.sheet is not None:
+            for idx in indices:
+                self.get(idx, scale())
+
+    def load(self):
+        sheet = get_img(Files.SPRITE_SHEET)
+        if pygame.display.get_surface() is not None:
+            # The sheet has an opaque black besides the transparent one,
+            # which convert() would mix up, so the transparent is replaced by KEY.
+            transparent = sheet.convert_alpha()
+            sheet = pygame.Surface(sheet.get_size()).convert()
+            sheet.fill(self.KEY)
+            sheet.blit(transparent, (0, 0))
+            sheet.set_colorkey(self.KEY)
+        self.sheet = sheet
+        self.sprites = {}
+
+    def prepare(self):
+        """Convert the sheet to the format of the display and scale the sprites for its size."""
+        self.load()
+        for indices, scale in self.uses:
+            for idx in indices:
+                self.get(idx, scale())
+
+    def get(self, idx, scale=2):
+        img = self.sprites.get((idx, scale))
+        if img is None:
+            if self.sheet is None:
+                self.prepare()
+                return self.get(idx, scale)
+            S = self.TILE
+            x = idx % 4
+            y = idx // 4
+            img = self.sheet.subsurface(x * S, y * S, S, S)
+            if scale > 1:
+                img = pygame.transform.scale(img, (S * scale, S * scale))
+            else:
+                img = img.copy()
+            # Skips the transparent runs when blitting
+            img.set_colorkey(self.sheet.get_colorkey(), pygame.RLEACCEL)
+            self.sprites[idx, scale] = img
+        return img
+
+
+sprites = SpriteAtlas()
+
+
 def sprite(idx, scale=2):
-    S = 16
-    x = idx % 4
-    y = idx // 4
-    img = get_img(Files.SPRITE_SHEET).subsurface(x * S, y * S, S, S)
-    if scale > 1:
-        img = pygame.transform.scale(img, (S * scale, S * scale))
-    return img
+    return sprites.get(idx, scale)
 
 
 @lru_cache()
@@ -110,9 +184,14 @@ def get_level_surf(idx):
     return get_img(Files.LEVELS).subsurface(x * 16, y * 16, 16, 16)
 
 
+_font_lock = Lock()
+
+
 @lru_cache()
 def get_font(size):
-    return pygame.font.Font(Files.FONT, size)
+    # SDL_ttf cannot open several fonts at the same time, and the asset loader opens them in the background
+    with _font_lock:
+        return pygame.font.Font(Files.FONT, size)
 
 
 @lru_cache(maxsize=100)
@@ -123,12 +202,59 @@ def get_text(txt, color, size):
     return get_font(size).render(str(txt), 0, color)
 
 
+class GlyphAtlas:
+    """The glyphs of a font size in one color, rendered once, to draw any text by blitting them.
+
+    The font has no kerning, so this draws exactly what rendering the whole text would."""
+
+    def __init__(self, size, color):
+        self.font = get_font(size)
+        self.color = color
+        self.glyphs = {}  # char -> (surface, advance)
+
+    def glyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            surf = self.font.render(char, 0, self.color)
+            if pygame.display.get_surface() is not None:
+                # Many times faster to blit in the format of the screen, skipping the transparent runs
+                surf = surf.convert()
+                surf.set_colorkey(surf.get_colorkey(), pygame.RLEACCEL)
+            glyph = self.glyphs[char] = surf, self.font.size(char)[0]
+        return glyph
+
+    def warm(self, chars):
+        for char in chars:
+            self.glyph(char)
+
+    def size(self, txt):
+        return sum(self.glyph(char)[1] for char in txt), self.font.get_height()
+
+    def draw(self, surf, txt, **anchor):
+        glyphs = [self.glyph(char) for char in txt]
+        rect = pygame.Rect(0, 0, sum(advance for _, advance in glyphs), self.font.get_height())
+        for name, value in anchor.items():
+            setattr(rect, name, value)
+
+        x, y = rect.topleft
+        blits = []
+        for glyph, advance in glyphs:
+            blits.append((glyph, (x, y)))
+            x += advance
+        surf.blits(blits, doreturn=False)
+        return rect
+
+
+@lru_cache()
+def get_atlas(size, color=None):
+    if color is None:
+        color = Color.BRIGHTEST
+    return GlyphAtlas(size, color)
+
+
 def draw_text(surf, txt, color=None, size=32, **anchor):
     assert len(anchor) == 1
-    tmp_surf = get_text(txt, color, round(size * Config().zoom))
-    rect = tmp_surf.get_rect(**anchor)
-    surf.blit(tmp_surf, rect)
-    return rect
+    return get_atlas(round(size * Config().zoom), color).draw(surf, str(txt), **anchor)
 
 
 def overlay(surf, color, alpha):
@@ -203,35 +329,39 @@ class Config:
                 self.wind_speed = ease(self.timer, self._wind_start, self._wind_end) * self._wind_speed_goal
             elif self._wind_end <= self.timer:
                 if self._wind_phase == 'up':
-                    self._wind_end = self.timer + gauss(60 * 6, 60)  # 6s ± 1s
+                    self._wind_end = self.timer + rng.gauss(60 * 6, 60)  # 6s ± 1s
                     self._wind_phase = 'const'
                 elif self._wind_phase == 'down':
-                    self._wind_end = self.timer + gauss(60 * 20, 60 * 3)  # 20s ± 3s
+                    self._wind_end = self.timer + rng.gauss(60 * 20, 60 * 3)  # 20s ± 3s
                     self._wind_speed_goal = 0
                     self.wind_speed = 0
                     self._wind_phase = 'const'
                 elif self._wind_speed_goal == 0:  # const -> up
                     self._wind_phase = 'up'
-                    direction = (random() > 0.5) * 2 - 1
-                    self._wind_speed_goal = gauss(3, 0.2) * direction  # px/frame
-                    self._wind_end = self.timer + gauss(60 * 3, 30)  # 3s ± 0.5s
+                    direction = (rng.random() > 0.5) * 2 - 1
+                    self._wind_speed_goal = rng.gauss(3, 0.2) * direction  # px/frame
+                    self._wind_end = self.timer + rng.gauss(60 * 3, 30)  # 3s ± 0.5s
                     get_sound('wind').play()
                 else:  # const -> down
                     self._wind_phase = 'down'
                     self._wind_speed_goal = 0
-                    self._wind_end = self.timer + gauss(60 * 3, 30)  # 3s ± 0.5s
+                    self._wind_end = self.timer + rng.gauss(60 * 3, 30)  # 3s ± 0.5s
                     get_sound('wind').fadeout(int((self.timer - self._wind_end) / 60 * 1000))
 
-    def fire(self):
+    def fire_among(self, count):
+        """Index of the brick that fires among count bricks, None if none does."""
         if not self.brick_fire_probability:
-            return False
+            return None
 
         if self.timer - self._last_fire < 60 * (5 - self.brick_fire_probability):
-            return False
-        t = random() < 0.001
-        if t:
-            self._last_fire = self.timer
-        return t
+            return None
+        # Each brick fires with a probability of 0.001, the first one that fires
+        # follows a geometric law, so one draw is enough whatever the number of bricks
+        first = int(log(1 - rng.random()) / log1p(-0.001))
+        if first >= count:
+            return None
+        self._last_fire = self.timer
+        return first
 
     def spawn_ball(self):
         # Spawn every 60s / level
@@ -1,11 +1,12 @@
-from math import sqrt
-from random import choice, gauss, random, randrange, uniform
-from typing import List, Union
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pygame
 
 from core import App, Object
-from locals import Color, clamp, Config, get_img, get_level_surf, get_sound, get_text, polar, settings, sprite
+import levels
+from locals import Color, clamp, Config, get_atlas, get_img, get_sound, polar, rng, settings, sprite, sprites
 
 config = Config()
 scale = config.scale
@@ -50,10 +51,25 @@ class Particle(Object):
         if self.decay_velocity:
             self.vel *= self.decay
 
+    @property
+    def radius(self):
+        return 5 * self.decay ** self.age * config.zoom
+
+    @property
+    def draw_rect(self):
+        if self.shape == self.DIAMOND:
+            extent = self.radius * 3
+        elif self.shape == self.LINE:
+            extent = self.vel.length() * 3 + self.size.x
+        else:
+            extent = self.size.y
+        extent = int(extent) + 2
+        return pygame.Rect(self.pos.x - extent, self.pos.y - extent, 2 * extent, 2 * extent)
+
     def draw(self, display):
         super(Particle, self).draw(display)
 
-        r = 5 * self.decay ** self.age * config.zoom
+        r = self.radius
         if self.shape == self.DIAMOND:
             draw_diamond(display, self.pos, self.vel, r, self.color)
         elif self.shape == self.LINE:
@@ -61,74 +77,29 @@ class Particle(Object):
         else:
             pygame.draw.circle(display, self.color, self.pos, self.size.y)
 
-    @classmethod
-    def wind_particle(cls):
-        conf = Config()
-        speed = conf.wind_speed
-        if speed > 0:
-            speed = max(1, speed)
-            x = 0
-        else:
-            speed = min(-1, speed)
-            x = conf.w
-        y = uniform(0, conf.h)
-
-        return Particle(
-            (x, y), (speed * 5, 0), 9999, 1,
-            size=randrange(1, 5),
-            shape=Particle.LINE,
-        )
-
-    @classmethod
-    def death_particles(cls, pos):
-        return Particle(
-            pos, polar(gauss(15, 3), uniform(0, 360)),
-            20,
-            color=Color.ORANGE,
-        )
-
-    @classmethod
-    def from_edges(cls, goal, lifespan=120, decay=0.98):
-        w, h = config.size
-        x = uniform(0, w)
-        y = uniform(0, h)
-
-        if random() < 0.5:
-            x = 0 if random() < 0.5 else w
-        else:
-            y = 0 if random() < 0.5 else h
-
-        path = pygame.Vector2(goal) - (x, y)
-        # HACK: We divide by zoom, to conpensate the zoom inside Particle's contructor
-        # So the velocity is just what is required to reach goal
-        vel = path / lifespan / Config().zoom
-
-        return Particle(
-            (x, y) - vel * 3,
-            vel,
-            lifespan + 0,
-            decay=decay,
-            decay_velocity=False
-        )
-
 
 class TextParticle(Particle):
     def __init__(self, txt, pos, vel, lifespan=30, decay=1, size=32, color=Color.GOLD):
         super().__init__(pos, vel, lifespan, decay, color=color)
         self.txt = txt
-        self.surf = get_text(txt, color, config.iscale(size))
+        self.atlas = get_atlas(config.iscale(size), color)
         self.font_size = size
 
     def resize(self, old, new):
         super().resize(old, new)
-        self.surf = get_text(self.txt, self.color, config.iscale(self.font_size))
+        self.atlas = get_atlas(config.iscale(self.font_size), self.color)
 
     def logic(self, state):
         super().logic(state)
 
+    @property
+    def draw_rect(self):
+        rect = pygame.Rect((0, 0), self.atlas.size(self.txt))
+        rect.center = self.pos
+        return rect
+
     def draw(self, display):
-        r = self.surf.get_rect(center=self.pos)
-        display.blit(self.surf, r)
+        self.atlas.draw(display, self.txt, center=self.pos)
         Object.draw(self, display)
 
 
@@ -142,7 +113,7 @@ class BackgroundShape(Object):
         self.color = color
         self.sides = shape
         self.angle = 0
-        self.vel = polar(gauss(2, 0.5), uniform(0, 360))
+        self.vel = polar(rng.gauss(2, 0.5), rng.uniform(0, 360))
 
     def logic(self, state):
         self.pos += self.vel
@@ -170,7 +141,7 @@ class BackgroundShape(Object):
     @classmethod
     def random(cls):
         w, h = Config().size
-        return cls((uniform(0, w), uniform(0, h)), gauss(30, 5), Color.DARK, randrange(3, 7))
+        return cls((rng.uniform(0, w), rng.uniform(0, h)), rng.gauss(30, 5), Color.DARK, rng.randrange(3, 7))
 
 
 class Bar(Object):
@@ -201,11 +172,11 @@ class Bar(Object):
             )
 
     def logic(self, state):
-        keys = pygame.key.get_pressed()
-        if any(keys[k] for k in self.K_LEFT):
+        inputs = App.CURRENT_APP.inputs
+        if inputs.is_pressed(self.K_LEFT):
             self.mouse_goal = None
             self.pos.x -= self.velocity * self.flip * Config().zoom
-        if any(keys[k] for k in self.K_RIGHT):
+        if inputs.is_pressed(self.K_RIGHT):
             self.mouse_goal = None
             self.pos.x += self.velocity * self.flip * Config().zoom
 
@@ -236,6 +207,8 @@ class Bar(Object):
 
 
 class Ball(Object):
+    """A ball, moved with all the others by the BallPhysics of its state."""
+
     RADIUS = 10
 
     def __init__(self, center, angle=None):
@@ -244,130 +217,20 @@ class Ball(Object):
         super().__init__(pos, size)
 
         if angle is None:
-            angle = gauss(-90, 10)
+            angle = rng.gauss(-90, 10)
         self.vel = polar(1, angle)
 
-    def logic(self, state):
-        vel = self.vel * Config().ball_speed * Config().zoom
-        if abs(vel.y) < 1:
-            vel.y = 1 if vel.y > 0 else -1
-        self.pos += vel
-        self.pos.x += Config().wind_speed
-
-        if self.pos.x < 0:
-            self.pos.x = 0
-            self.vel.x *= -1
-        if self.pos.x > state.w - self.size.x:
-            self.pos.x = state.w - self.size.x
-            self.vel.x *= -1
-        if self.pos.y < 0:
-            self.pos.y = 0
-            self.vel.y *= -1
-        if self.pos.y > state.h:
-            self.alive = False
-
-        # Collision with bars
-        if self.vel.y > 0:
-            for bar in state.get_all(Bar):
-                r = self.rect
-                br: pygame.Rect = bar.rect
-                if self.rect_collision(br) is not None:
-                    dx = (r.centerx - br.centerx) / br.width * 2  # proportion on the side
-                    dx = clamp(dx, -0.8, 0.8)
-
-                    angle = (-dx + 1) * 90
-                    self.vel.from_polar((1, -angle))
-
-                    get_sound('bong').play()
-
-        # Collision against bricks
-        for bricks in state.get_all(Bricks):
-            for brick in bricks.all_bricks():
-                # TODO: only the bricks in the ball's rectangle
-                if (n := self.rect_collision(brick.rect)) is not None:
-                    vel_along_normal = n.dot(self.vel)
-                    if vel_along_normal < 0:
-                        continue  # Already separating
-                    brick.hit(state)
-                    # invert velocity along the normal
-                    if brick.SOLID:
-                        self.vel -= 2 * vel_along_normal * n
-
     def draw(self, display):
         super(Ball, self).draw(display)
 
         pygame.draw.circle(display, Color.BRIGHT, self.rect.center, self.size.x / 2)
         pygame.draw.circle(display, Color.BRIGHTEST, self.rect.center, self.size.x / 2 * 0.75)
 
-    def rect_collision(self, rect):
-        """Return the normal of the collision between a ball and a rect.
-
-        Return None if there is no collision. The velocity of the ball """
-
-        center = pygame.Vector2(self.rect.center)
-        # Find the closest point to the circle within the rectangle
-        closest = pygame.Vector2(
-            clamp(center.x, rect.left, rect.right),
-            clamp(center.y, rect.top, rect.bottom)
-        )
-
-        # Calculate the distance between the circle's center and self closest point
-        d = center - closest
-
-        # If the distance is less than the circle's radius, an intersection occurs
-        norm2 = d.length_squared()
-        if norm2 >= (self.size.x / 2) ** 2:  # .x == .y and is the diameter
-            return None
-
-        if closest == center:
-            # Circle is inside the AABB, so we need to clamp the circle's center
-            # to the closest edge
-
-            left = center.x - rect.left
-            top = center.y - rect.top
-            right = rect.right - center.x
-            bottom = rect.bottom - center.y
-
-            mini = min(left, top, right, bottom)
-            if mini == left:
-                closest.x = rect.left
-                normal_bkp = (-1, 0)  # Those normal are for the rare case when the center is exactly on the border
-            elif mini == right:
-                closest.x = rect.right
-                normal_bkp = (1, 0)
-            elif mini == top:
-                closest.y = rect.top
-                normal_bkp = (0, -1)
-            elif mini == bottom:
-                closest.y = rect.bottom
-                normal_bkp = (0, 1)
-
-            normal = center - closest
-            n = normal.length()
-
-            if n == 0:
-                # noinspection PyUnboundLocalVariable
-                return pygame.Vector2(normal_bkp)
-
-            return normal / n
-            # return (
-            #     normal.dividedBy(-n),  # Out direction
-            #     self.RADIUS - n  # penetration
-            # )
-        else:
-            norm = sqrt(norm2)
-            return d / -norm
-            # return (
-            #     d.dividedBy(-norm),  # Out direction
-            #     self.RADIUS - norm  # penetration
-            # )
-
     def on_death(self, game):
         settings.balls_lost += 1
         game.do_shake(5)
-        nb = 10 if len(list(game.get_all(Ball))) > 1 else 45
-        for _ in range(nb):
-            game.add(Particle.death_particles(self.pos))
+        nb = 10 if game.count(Ball) > 1 else 45
+        game.particles.death_particles(self.pos, nb)
 
 
 class EnemyBullet(Object):
@@ -388,13 +251,17 @@ class EnemyBullet(Object):
                 settings.bullet_hit += 1
                 game.loose_life()
                 self.alive = False
-                for _ in range(self.EXPLOSION_PARTICLES):
-                    game.add(Particle.death_particles(self.pos))
+                game.particles.death_particles(self.pos, self.EXPLOSION_PARTICLES)
 
         w, h = Config().size
         if not self.rect.colliderect((0, 0, w, h)):
             self.alive = False
 
+    @property
+    def draw_rect(self):
+        extent = int(self.size.x * 3) + 2
+        return pygame.Rect(0, 0, 2 * extent, 2 * extent).move(self.rect.center).move(-extent, -extent)
+
     def draw(self, display):
         super().draw(display)
         draw_diamond(display, self.rect.center, self.vel, self.size.x, Color.ORANGE)
@@ -402,29 +269,47 @@ class EnemyBullet(Object):
 
 class Bricks(Object):
     WINDOW_PROP = 0.8
+    STATIC = True
+
+    # Shapes of regions
+    SQUARE = 0
+    CROSS = 1
+    CIRCLE = 2
 
-    def __init__(self, lines=15, cols=15):
+    # Flags of a cell
+    ALIVE = 1  # Cleared when the brick dies, it stays in the grid until the next logic
+
+    sprite_lines = set()  # Numbers of lines of the grids whose brick sprites are prescaled
+
+    def __init__(self, lines=levels.SIZE, cols=levels.SIZE):
         size = (Config().w, Config().h * self.WINDOW_PROP)
         super(Bricks, self).__init__((0, 0), size)
         self.lines = lines
         self.cols = cols
 
-        self.bricks = [
-            [None] * cols
-            for _ in range(lines)
-        ]  # type: List[List[Union[None, Brick]]]
+        # The bricks are only arrays, Brick objects are made for the few cells that need one
+        self.kinds = np.zeros((lines, cols), np.uint8)  # Code of the kind of each brick, see KINDS, 0 if empty
+        self.life = np.zeros((lines, cols), np.int16)
+        self.flags = np.zeros((lines, cols), np.uint8)
+        self.views = {}  # type: Dict[Tuple[int, int], Brick]  # Brick objects of the cells
+        self.live = 0  # Number of bricks alive, the dead ones are removed by the next logic
+        self.dead = []  # type: List[Tuple[int, int]]  # Cells whose brick died since the last logic
+        self.dirty_cells = set()  # Cells that changed since the last draw
+        self.layer = None  # type: Optional[pygame.Surface]  # All the bricks, pre-rendered
 
     def resize(self, old, new):
         super().resize(old, new)
         self.size = pygame.Vector2(new.x, new.y * self.WINDOW_PROP)
 
-        for (l, c), brick in self.all_bricks(True):
+        for (l, c), brick in self.views.items():
             brick.resize(old, new)
             brick.pos = self.to_screen(l, c)
             brick.size = self.brick_size
+        self.layer = None
+        brick_image.cache_clear()
 
     def __len__(self):
-        return sum(1 for _ in self.all_bricks())
+        return self.live
 
     @property
     def line_height(self):
@@ -447,73 +332,196 @@ class Bricks(Object):
     def to_grid(self, pos):
         return pos[1] // self.line_height, pos[0] // self.col_width
 
+    def cell_rect(self, line, col):
+        # Bricks draw their bottom and right border one pixel outside
+        return pygame.Rect(self.to_screen(line, col), self.brick_size).inflate(2, 2)
+
+    def invalidate(self, line, col):
+        """Mark a cell as changed, so it is redrawn."""
+        self.dirty_cells.add((line, col))
+
+    def invalidate_all(self):
+        self.layer = None
+
+    def changed_rects(self):
+        if self.layer is None:
+            return [self.draw_rect]
+        return [self.cell_rect(l, c) for l, c in self.dirty_cells]
+
+    def brick(self, line, col):
+        """The Brick object of a cell, made the first time it is needed. None if the cell is empty."""
+        brick = self.views.get((line, col))
+        if brick is None:
+            kind = self.kinds[line, col]
+            if not kind:
+                return None
+            brick = KINDS[kind](self.to_screen(line, col), self.brick_size)
+            brick.grid = self
+            brick.cell = (line, col)
+            self.views[line, col] = brick
+        return brick
+
+    def detach(self, line, col):
+        """Forget the Brick object of a cell, keeping its last state in it."""
+        brick = self.views.pop((line, col), None)
+        if brick is not None:
+            brick._life = int(self.life[line, col])
+            brick._alive = bool(self.flags[line, col] & self.ALIVE)
+            brick.grid = None
+
+    def cells(self, l0, l1, c0, c1):
+        """Cells with a brick such that l0 <= line < l1 and c0 <= col < c1, line by line."""
+        l0 = max(0, l0)
+        c0 = max(0, c0)
+        l1 = max(l0, min(self.lines, l1))
+        c1 = max(c0, min(self.cols, c1))
+        lines, cols = np.nonzero(self.kinds[l0:l1, c0:c1])
+        return zip((lines + l0).tolist(), (cols + c0).tolist())
+
     def all_bricks(self, indices=False):
-        for l, line in enumerate(self.bricks):
-            for c, brick in enumerate(line):
-                if brick is not None:
-                    if indices:
-                        yield (l, c), brick
-                    else:
-                        yield brick
-
-    def brick_range(self, x, y, w, h):
-        for (c, l), brick in self.all_bricks(True):
-            if x <= c < x + w and y <= l < y + h:
-                yield brick
+        """All the bricks, line by line. This makes a Brick object for every cell."""
+        for l, c in self.cells(0, self.lines, 0, self.cols):
+            if indices:
+                yield (l, c), self.brick(l, c)
+            else:
+                yield self.brick(l, c)
+
+    def bricks_in_rect(self, rect):
+        """Bricks whose cell overlaps the rect, in the same order as all_bricks()."""
+        # Brick rects are truncated to integers and can stick out of their cell
+        rect = pygame.Rect(rect).inflate(4, 4)
+        l0, c0 = self.to_grid(rect.topleft)
+        l1, c1 = self.to_grid(rect.bottomright)
+        for l, c in self.cells(int(l0), int(l1) + 1, int(c0), int(c1) + 1):
+            yield self.brick(l, c)
+
+    def region(self, line, col, radius=1, shape=SQUARE):
+        """Bricks at most radius cells away from (line, col), including it.
+
+        With a SQUARE shape, diagonals count as one cell, with CROSS only
+        the bricks on the same line or column are returned, and with CIRCLE
+        those within the euclidean distance."""
+
+        for l, c in self.cells(line - radius, line + radius + 1, col - radius, col + radius + 1):
+            dl = l - line
+            dc = c - col
+            if shape == self.CROSS and dl and dc:
+                continue
+            if shape == self.CIRCLE and dl * dl + dc * dc > radius * radius:
+                continue
+            yield self.brick(l, c)
+
+    def strengthen(self, hits=1):
+        """Add hits to the life of every brick that does not break in one hit."""
+        self.life[(self.kinds != 0) & ~SINGLE_HIT[self.kinds]] += hits
+        self.invalidate_all()
 
     def draw(self, display):
         super().draw(display)
-        for brick in self.all_bricks():
-            if brick is not None:
-                brick.draw(display)
+
+        if self.layer is None:
+            # Bricks draw their border one pixel outside of their rect
+            self.layer = pygame.Surface(self.size + (1, 1), pygame.SRCALPHA)
+            if pygame.display.get_surface() is not None:
+                # Blitted at each full redraw, so in the format of the screen
+                self.layer = self.layer.convert_alpha()
+            cells = self.cells(0, self.lines, 0, self.cols)
+            self.layer.blits([self.cell_image(l, c) for l, c in cells], doreturn=False)
+        else:
+            for l, c in self.dirty_cells:
+                self.render_cell(l, c)
+        self.dirty_cells.clear()
+
+        display.blit(self.layer, self.pos)
+
+    def cell_image(self, line, col):
+        """The image of the brick of a cell and where to blit it."""
+        rect = pygame.Rect(self.to_screen(line, col), self.brick_size)
+        return brick_image(KINDS[self.kinds[line, col]], int(self.life[line, col]), rect.size), rect
+
+    def render_cell(self, line, col):
+        """Redraw one cell of the layer, with the borders of its neighbors that overlap it."""
+        area = self.cell_rect(line, col)
+        self.layer.set_clip(area)
+        self.layer.fill((0, 0, 0, 0), area)
+        for l, c in self.cells(line - 1, line + 2, col - 1, col + 2):
+            self.layer.blit(*self.cell_image(l, c))
+        self.layer.set_clip(None)
 
     def logic(self, state):
-        for (l, c), brick in self.all_bricks(True):
-            if brick is not None:
-                if not brick.alive:
-                    self.bricks[l][c] = None
-                else:
-                    brick.logic(state)
+        dead = self.dead
+        self.dead = []
+        for l, c in dead:
+            # It may have been replaced since
+            if self.kinds[l, c] and not self.flags[l, c] & self.ALIVE:
+                self.place(l, c, None)
+
+        # Nothing runs for every brick, only the rare one that fires needs a Brick
+        shooter = Config().fire_among(self.live)
+        if shooter is not None:
+            l, c = np.argwhere(self.flags & self.ALIVE)[shooter].tolist()
+            self.brick(l, c).shoot(state)
+
+    def place(self, l, c, kind):
+        """Put a new brick of the given class in a cell, or empty it with None."""
+
+        self.detach(l, c)
+        self.live += (kind is not None) - bool(self.flags[l, c] & self.ALIVE)
+        self.invalidate(l, c)
+        if kind is None:
+            self.kinds[l, c] = 0
+            self.flags[l, c] = 0
+        else:
+            self.kinds[l, c] = CODES[kind]
+            self.life[l, c] = 1 if kind.SINGLE_HIT else Config().brick_life
+            self.flags[l, c] = self.ALIVE
+
+    @classmethod
+    def build(cls, idx):
+        """The bricks of a level of the pack played."""
+        level = levels.pack()[idx]
+        lvl = Bricks(level.lines, level.cols)
+        kinds = np.frombuffer(level.kinds, np.uint8).reshape(level.lines, level.cols)
+        lives = np.frombuffer(level.lives, np.uint8).reshape(level.lines, level.cols)
+
+        unknown = set(np.unique(kinds).tolist()) - {0, *KINDS}
+        if unknown:
+            raise ValueError(f"Unknown kinds of bricks in level {idx}: {sorted(unknown)}")
+
+        lvl.kinds[:] = kinds
+        lvl.life[:] = np.where(SINGLE_HIT[kinds], 1, Config().brick_life + lives)
+        lvl.flags[kinds != 0] = cls.ALIVE
+        lvl.live = int(np.count_nonzero(kinds))
+        return lvl
+
+    @classmethod
+    def use_sprites(cls, lines):
+        """Have the sprites of the bricks prescaled for grids of that many lines, at each size of the display."""
+        if lines not in cls.sprite_lines:
+            cls.sprite_lines.add(lines)
+            # Like in Brick.render()
+            sprites.use(BRICK_SPRITES, lambda: round(int(Config().h * cls.WINDOW_PROP / lines) / 16))
 
     @classmethod
     def load(cls, level):
-        sprite = get_level_surf(level)
-        lvl = Bricks()
-        palette = list(sprite.get_palette())
-        for l in range(15):
-            for c in range(15):
-                color = sprite.get_at((c, l))
-                kind = palette.index(color)
-                brick = lvl.make_brick(kind, l, c)
-                lvl.bricks[l][c] = brick
+        lvl = levels.prebuilt.take(level, cls.build)
+        # Here and not in build(), which runs in the background
+        cls.use_sprites(lvl.lines)
 
         # Power up some bricks
+        cells = np.argwhere(lvl.kinds).tolist()
         for brick, nb in Config().bricks_levels.items():
             for _ in range(nb):
-                (l, c), _ = choice(list(lvl.all_bricks(True)))
-                lvl.bricks[l][c] = lvl.make_brick(brick, l, c)
+                l, c = rng.choice(cells)
+                lvl.place(l, c, brick)
         return lvl
 
-    def make_brick(self, kind, l, c):
-
-        if isinstance(kind, int):
-            if kind < 1:
-                return None
-
-            kind = {
-                3: GlassBrick,
-                5: Brick,
-                10: DoubleBrick,
-                12: BombBrick,
-            }[kind]
-
-        return kind(self.to_screen(l, c), self.brick_size)
-
     @classmethod
     def random(cls):
-        idx = randrange(0, 13)
+        idx = rng.randrange(0, levels.playable())
         return cls.load(idx)
 
+
 class Brick(Object):
     PARTICLES = 6
     SPRITE = None
@@ -523,20 +531,58 @@ class Brick(Object):
 
     def __init__(self, pos, size):
         super().__init__(pos, size)
-        self.life = Config().brick_life if not self.SINGLE_HIT else 1
+        self.grid = None  # type: Optional[Bricks]  # Holds the life of the brick, when in one
+        self.cell = (0, 0)
+        self._life = Config().brick_life if not self.SINGLE_HIT else 1
+
+    @property
+    def life(self):
+        if self.grid is None:
+            return self._life
+        return int(self.grid.life[self.cell])
+
+    @life.setter
+    def life(self, value):
+        if self.grid is None:
+            self._life = value
+        else:
+            self.grid.life[self.cell] = value
+
+    @property
+    def alive(self):
+        if self.grid is None:
+            return self._alive
+        return bool(self.grid.flags[self.cell] & Bricks.ALIVE)
+
+    @alive.setter
+    def alive(self, value):
+        if self.grid is None:
+            self._alive = value
+        elif self.alive and not value:
+            # Bricks are not in the state, they tell their grid instead
+            self.grid.flags[self.cell] ^= Bricks.ALIVE
+            self.grid.live -= 1
+            self.grid.dead.append(self.cell)
 
     def __repr__(self):
         return f"<Brick({self.pos.x}, {self.pos.y})>"
 
     def draw(self, display):
-        if self.COLOR:
-            display.fill(self.COLOR, self.rect)
-        border = 2 + 2 * self.life
+        rect = self.rect
+        display.blit(brick_image(type(self), self.life, rect.size), rect)
+        super().draw(display)
+
+    @classmethod
+    def render(cls, display, rect, life):
+        """Draw a brick of this kind from primitives."""
+        if cls.COLOR:
+            display.fill(cls.COLOR, rect)
+        border = 2 + 2 * life
         tl, tr, br, bl = [
-            self.rect.topleft,
-            self.rect.topright,
-            self.rect.bottomright,
-            self.rect.bottomleft
+            rect.topleft,
+            rect.topright,
+            rect.bottomright,
+            rect.bottomleft
         ]
         for i in range(border):
             d1 = pygame.Vector2(i, i)
@@ -546,16 +592,16 @@ class Brick(Object):
             pygame.draw.line(display, Color.BRIGHTEST, tl + d1, tr + d2)
             pygame.draw.line(display, Color.BRIGHTEST, tl + d1, bl - d2)
 
-        if self.SPRITE is not None:
-            img = sprite(self.SPRITE, round(self.size.y / 16))
-            r = img.get_rect(center=self.rect.center)
+        if cls.SPRITE is not None:
+            img = sprite(cls.SPRITE, round(rect.height / 16))
+            r = img.get_rect(center=rect.center)
             display.blit(img, r)
 
-        super().draw(display)
-
     def hit(self, game, sound=True, damage=1):
         get_sound('hit').play()
         self.life -= damage
+        if self.grid is not None:
+            self.grid.invalidate(*self.cell)
         if self.life <= 0:
             settings.bricks_destroyed += 1
             self.alive = False
@@ -569,31 +615,35 @@ class Brick(Object):
             game.add(TextParticle(f"+{score}", self.rect.center, (0, -1), 20, size=24))
             particles = self.PARTICLES // 2
 
-        for _ in range(particles):
-            game.add(Particle(
-                self.rect.center,
-                polar(gauss(13, 3), uniform(0, 360)),
-                15
-            ))
+        game.particles.burst(self.rect.center, particles, 13, 3, 15)
 
-    def logic(self, state):
-        if Config().fire():
-            bar = next(state.get_all(Bar))
-            get_sound('pre-shot').play()
+    def shoot(self, state):
+        bar = next(state.get_all(Bar))
+        get_sound('pre-shot').play()
+
+        # Compute earlier, it is more forgiving
+        dir = bar.rect.center - self.pos
+        @state.add
+        @Schedule.at(+60)
+        def _():
+            get_sound('shot').play()
+            state.add(EnemyBullet(self.rect.center, dir))
 
-            # Compute earlier, it is more forgiving
-            dir = bar.rect.center - self.pos
-            @state.add
-            @Schedule.at(+60)
-            def _():
-                get_sound('shot').play()
-                state.add(EnemyBullet(self.rect.center, dir))
+
+@lru_cache(maxsize=64)
+def brick_image(kind, life, size):
+    """The look of a brick, keyed by its class, its life and its size in pixels."""
+    # Bricks draw their border one pixel outside of their rect
+    surf = pygame.Surface((size[0] + 1, size[1] + 1), pygame.SRCALPHA)
+    kind.render(surf, pygame.Rect((0, 0), size), life)
+    return surf
 
 
 class BombBrick(Brick):
     SPRITE = 16
     PARTICLES = 35
     SINGLE_HIT = True
+    RADIUS = 1  # The explosion hits a square of 3×3 bricks
 
     def hit(self, game, sound=True, damage=1):
         if not self.alive:
@@ -603,8 +653,8 @@ class BombBrick(Brick):
         super(BombBrick, self).hit(game, False)
 
         level: Bricks = game.bricks
-        x, y = level.to_grid(self.rect.center)
-        for brick in level.brick_range(x - 1, y - 1, 3, 3):
+        line, col = level.to_grid(self.rect.center)
+        for brick in level.region(int(line), int(col), self.RADIUS):
             if brick is not self:
                 brick.hit(game, sound=False, damage=3)
 
@@ -625,6 +675,21 @@ class GlassBrick(Brick):
     SOLID = False
 
 
+# Code of each kind of brick in the levels and the grids
+KINDS = {
+    3: GlassBrick,
+    5: Brick,
+    10: DoubleBrick,
+    12: BombBrick,
+}
+CODES = {kind: code for code, kind in KINDS.items()}
+SINGLE_HIT = np.zeros(256, bool)  # Indexed by code
+for code, kind in KINDS.items():
+    SINGLE_HIT[code] = kind.SINGLE_HIT
+
+BRICK_SPRITES = [kind.SPRITE for kind in KINDS.values() if kind.SPRITE is not None]
+Bricks.use_sprites(levels.SIZE)
+
 
 class Schedule(Object):
     def __init__(self, func, delay):
@@ -0,0 +1,318 @@
+"""All the small particles of a state, stored as NumPy arrays.
+
+Particles are too many and too short lived to each be an Object, so a
+ParticleSystem keeps their positions, velocities, ages... in arrays that
+are updated all at once. Dead particles are replaced by the last alive
+ones, so the alive particles are always the first `count` of each array,
+and the slots of dead particles are reused by the next ones.
+
+The total number of particles is capped by the global budget. When it is
+full, the particles that are off screen and then the oldest are evicted
+to make room for new ones, first from the system that emits, then from
+the others in the order they were created."""
+
+from weakref import WeakKeyDictionary
+
+import numpy as np
+import pygame
+
+from core import Object
+from locals import Color, Config, rng
+from profiler import profiler
+
+class ParticleBudget:
+    """Cap on the number of particles alive in all the particle systems."""
+
+    def __init__(self, cap=5000):
+        self.cap = cap
+        self.systems = WeakKeyDictionary()  # Used as an ordered set, so evictions replay the same
+
+        # Statistics
+        self.cap_hits = 0  # Number of emissions that did not fit
+        self.evicted = 0  # Particles removed early to make room
+        self.dropped = 0  # New particles that were not emitted at all
+
+    @property
+    def live(self):
+        return sum(system.count for system in self.systems)
+
+    def __repr__(self):
+        return (f"<ParticleBudget({self.live}/{self.cap}, cap hits: {self.cap_hits}, "
+                f"evicted: {self.evicted}, dropped: {self.dropped})>")
+
+
+budget = ParticleBudget()
+
+
+class ParticleSystem(Object):
+    DIAMOND = 0
+    LINE = 1
+    CIRCLE = 2
+    Z = 1
+
+    def __init__(self, capacity=256):
+        super().__init__((0, 0), (0, 0))
+        self.count = 0
+        self.alpha = 1  # Interpolation of the current draw
+        self.palette = []  # Colors of the particles, indexed by self.colors
+        self.rng = np.random.default_rng(rng.getrandbits(64))  # Seeded by the session
+        self._color_index = {}
+
+        self.positions = np.zeros((capacity, 2))
+        self.previous = np.zeros((capacity, 2))  # Positions on the previous tick
+        self.velocities = np.zeros((capacity, 2))
+        self.ages = np.zeros(capacity, dtype=np.int32)
+        self.lifespans = np.zeros(capacity, dtype=np.int32)
+        self.decays = np.zeros(capacity)
+        self.sizes = np.zeros(capacity)
+        self.colors = np.zeros(capacity, dtype=np.uint8)
+        self.shapes = np.zeros(capacity, dtype=np.uint8)
+        self.decay_velocity = np.zeros(capacity, dtype=bool)
+        budget.systems[self] = None
+
+    ARRAYS = ('positions', 'previous', 'velocities', 'ages', 'lifespans', 'decays',
+              'sizes', 'colors', 'shapes', 'decay_velocity')
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.ages)
+
+    def reserve(self, capacity):
+        """Grow the arrays so they can hold at least capacity particles."""
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def color_index(self, color):
+        try:
+            return self._color_index[color]
+        except KeyError:
+            self.palette.append(pygame.Color(color))
+            idx = self._color_index[color] = len(self.palette) - 1
+            return idx
+
+    def emit(self, positions, velocities, lifespan, decay=0.95, size=2,
+             color=Color.BRIGHTEST, shape=DIAMOND, decay_velocity=True):
+        """Add particles. positions and velocities can be a single vector or one per row.
+
+        Like for objects, the velocity and size are given for the design size
+        of the window and are adjusted to the current zoom here."""
+
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        velocities = np.atleast_2d(np.asarray(velocities, dtype=float))
+        nb = max(len(positions), len(velocities))
+        nb = self.make_room(nb)
+        if nb == 0:
+            return
+        positions = positions[-nb:]
+        velocities = velocities[-nb:]
+
+        zoom = Config().zoom
+        start = self.count
+        end = start + nb
+        self.reserve(end)
+
+        self.positions[start:end] = positions
+        self.previous[start:end] = positions
+        self.velocities[start:end] = velocities * zoom
+        self.ages[start:end] = 0
+        self.lifespans[start:end] = lifespan
+        self.decays[start:end] = decay
+        self.sizes[start:end] = np.asarray(size) * zoom
+        self.colors[start:end] = self.color_index(color)
+        self.shapes[start:end] = shape
+        self.decay_velocity[start:end] = decay_velocity
+        self.count = end
+
+    def make_room(self, nb):
+        """Evict particles so that nb more fit in the budget. Return how many actually fit."""
+
+        excess = budget.live + nb - budget.cap
+        if excess <= 0:
+            return nb
+
+        budget.cap_hits += 1
+        profiler.count('particle cap hits')
+
+        evict = 0
+        for system in [self, *(system for system in budget.systems if system is not self)]:
+            if evict == excess:
+                break
+            evict += system.evict(min(excess - evict, system.count))
+        budget.evicted += evict
+        profiler.count('particles evicted', evict)
+
+        dropped = min(nb, excess - evict)
+        budget.dropped += dropped
+        return nb - dropped
+
+    def evict(self, nb):
+        """Remove the nb least visible particles: off screen, then the oldest. Return nb."""
+
+        n = self.count
+        if not nb:
+            return 0
+        w, h = Config().size
+        x, y = self.positions[:n, 0], self.positions[:n, 1]
+        offscreen = (x < 0) | (x > w) | (y < 0) | (y > h)
+        priority = self.ages[:n] + offscreen * np.iinfo(np.int32).max // 2
+        victims = np.argpartition(priority, n - nb)[n - nb:]
+        dead = np.zeros(n, dtype=bool)
+        dead[victims] = True
+        self.remove(dead)
+        return nb
+
+    def burst(self, pos, nb, speed, spread, lifespan, color=Color.BRIGHTEST):
+        """Emit nb particles from pos in every direction, at a speed of speed ± spread."""
+        angles = self.rng.uniform(0, 2 * np.pi, nb)
+        speeds = self.rng.normal(speed, spread, nb)
+        velocities = np.column_stack((np.cos(angles), np.sin(angles))) * speeds[:, None]
+        self.emit(np.broadcast_to(tuple(pos), (nb, 2)), velocities, lifespan, color=color)
+
+    def death_particles(self, pos, nb=1):
+        self.burst(pos, nb, 15, 3, 20, Color.ORANGE)
+
+    def wind_particle(self):
+        conf = Config()
+        speed = conf.wind_speed
+        if speed > 0:
+            speed = max(1, speed)
+            x = 0
+        else:
+            speed = min(-1, speed)
+            x = conf.w
+        y = self.rng.uniform(0, conf.h)
+
+        self.emit((x, y), (speed * 5, 0), 9999, 1, size=self.rng.integers(1, 5), shape=self.LINE)
+
+    def from_edges(self, goal, nb=1, lifespan=120, decay=0.98):
+        """Emit nb particles from the edges of the screen that reach goal at the end of their life."""
+        w, h = Config().size
+        starts = self.rng.uniform((0, 0), (w, h), (nb, 2))
+
+        # Snap each particle to one of the four edges
+        axis = self.rng.random(nb) < 0.5
+        side = np.where(self.rng.random(nb) < 0.5, 0, np.where(axis, w, h))
+        starts[axis, 0] = side[axis]
+        starts[~axis, 1] = side[~axis]
+
+        # We divide by zoom, to compensate the zoom inside emit(),
+        # so the velocity is just what is required to reach goal
+        velocities = (np.asarray(goal, dtype=float) - starts) / lifespan / Config().zoom
+
+        self.emit(starts - velocities * 3, velocities, lifespan, decay=decay, decay_velocity=False)
+
+    def logic(self, state):
+        n = self.count
+        if not n:
+            return
+
+        self.previous[:n] = self.positions[:n]
+        self.ages[:n] += 1
+        self.positions[:n] += self.velocities[:n]
+        factor = np.where(self.decay_velocity[:n], self.decays[:n], 1)
+        self.velocities[:n] *= factor[:, None]
+
+        self.remove(self.ages[:n] > self.lifespans[:n])
+
+    def remove(self, dead):
+        """Remove the particles where the mask dead is true, by moving the last ones in their place."""
+
+        n = self.count
+        nb_dead = np.count_nonzero(dead)
+        if not nb_dead:
+            return
+
+        alive = n - nb_dead
+        holes = np.flatnonzero(dead[:alive])
+        movers = np.flatnonzero(~dead[alive:]) + alive
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            array[holes] = array[movers]
+        self.count = alive
+
+    def resize(self, old, new):
+        ratio = new.x / old.x
+        n = self.count
+        self.positions[:n] *= ratio
+        self.previous[:n] *= ratio
+        self.velocities[:n] *= ratio
+        self.sizes[:n] *= ratio
+
+    def draw_interpolated(self, display, alpha):
+        self.alpha = alpha
+        self.draw(display)
+
+    def draw_positions(self):
+        n = self.count
+        if self.alpha >= 1:
+            return self.positions[:n]
+        return self.previous[:n] + (self.positions[:n] - self.previous[:n]) * self.alpha
+
+    @property
+    def radii(self):
+        return 5 * self.decays[:self.count] ** self.ages[:self.count] * Config().zoom
+
+    @property
+    def draw_rect(self):
+        n = self.count
+        if not n:
+            return pygame.Rect(0, 0, 0, 0)
+        pos = self.draw_positions()
+        extent = np.maximum(self.radii * 3, self.sizes[:n] + np.abs(self.velocities[:n]).max(axis=1) * 3)
+        low = (pos - extent[:, None]).min(axis=0) - 2
+        high = (pos + extent[:, None]).max(axis=0) + 2
+        return pygame.Rect(int(low[0]), int(low[1]), int(high[0] - low[0]) + 1, int(high[1] - low[1]) + 1)
+
+    def draw(self, display):
+        n = self.count
+        if not n:
+            return
+
+        pos = self.draw_positions()
+        vel = self.velocities[:n]
+        shapes = self.shapes[:n]
+        colors = self.colors[:n]
+        palette = self.palette
+
+        diamonds = np.flatnonzero(shapes == self.DIAMOND)
+        if len(diamonds):
+            p = pos[diamonds]
+            v = vel[diamonds]
+            r = self.radii[diamonds][:, None]
+            norm = np.hypot(v[:, 0], v[:, 1])[:, None]
+            direction = v / np.where(norm == 0, 1, norm)
+            cross = np.column_stack((-direction[:, 1], direction[:, 0]))
+            vertices = np.stack((
+                p + direction * r,
+                p + cross * r,
+                p - direction * r * 3,
+                p - cross * r,
+            ), axis=1).tolist()
+            polygon = pygame.draw.polygon
+            for color, verts in zip(colors[diamonds].tolist(), vertices):
+                polygon(display, palette[color], verts)
+
+        lines = np.flatnonzero(shapes == self.LINE)
+        if len(lines):
+            starts = pos[lines]
+            ends = (starts + vel[lines] * 3).tolist()
+            widths = np.round(self.sizes[lines]).astype(int).tolist()
+            line = pygame.draw.line
+            for color, start, end, width in zip(colors[lines].tolist(), starts.tolist(), ends, widths):
+                line(display, palette[color], start, end, width)
+
+        circles = np.flatnonzero(shapes == self.CIRCLE)
+        if len(circles):
+            circle = pygame.draw.circle
+            for color, center, radius in zip(colors[circles].tolist(), pos[circles].tolist(),
+                                             self.sizes[circles].tolist()):
+                circle(display, palette[color], center, radius)
@@ -0,0 +1,198 @@
+"""Move all the balls of a state at once with NumPy.
+
+The integration, the walls and the circle vs rectangle tests are done for
+every ball at the same time. Only the reactions to the collisions, which
+are rare, are done one by one, in the order of the balls."""
+
+import numpy as np
+import pygame
+
+from core import Object
+from locals import clamp, Config, get_sound
+from objects import Ball, Bar, Bricks
+from profiler import profiler
+
+# Fraction of the radius, or of half the thinnest brick, a ball can move
+# in one sub-step. Faster balls are moved in several sub-steps per tick.
+MAX_STEP = 1
+
+
+def circle_rect_normals(cx, cy, radius, left, top, right, bottom):
+    """Collisions between circles and rectangles.
+
+    Return a mask of the circles that collide with their rectangle and
+    the normals of the collisions, that are only meaningful where the mask is true."""
+
+    closest_x = np.clip(cx, left, right)
+    closest_y = np.clip(cy, top, bottom)
+    dx = cx - closest_x
+    dy = cy - closest_y
+    norm2 = dx * dx + dy * dy
+    hit = norm2 < radius * radius
+
+    # Center outside of the rectangle: the normal points to the closest point.
+    # Vector2 divides by multiplying with the inverse, so we do the same
+    # to get exactly the same normals.
+    norm = np.sqrt(norm2)
+    inv = 1 / -np.where(norm == 0, 1, norm)
+    nx = dx * inv
+    ny = dy * inv
+
+    # Center inside of the rectangle: use the closest edge
+    inside = (closest_x == cx) & (closest_y == cy)
+    if inside.any():
+        to_left = cx - left
+        to_top = cy - top
+        to_right = right - cx
+        to_bottom = bottom - cy
+        mini = np.minimum(np.minimum(to_left, to_top), np.minimum(to_right, to_bottom))
+        # Priority to the left, right, top then bottom edge
+        edge = np.select([mini == to_left, mini == to_right, mini == to_top], [0, 1, 2], 3)
+        edge_x = np.select([edge == 0, edge == 1], [left, right], cx)
+        edge_y = np.select([edge == 2, edge == 3], [top, bottom], cy)
+        normal_x = cx - edge_x
+        normal_y = cy - edge_y
+        n = np.sqrt(normal_x * normal_x + normal_y * normal_y)
+        backup_x = np.select([edge == 0, edge == 1], [-1, 1], 0)
+        backup_y = np.select([edge == 2, edge == 3], [-1, 1], 0)
+        inv = 1 / np.where(n == 0, 1, n)
+        nx = np.where(inside, np.where(n == 0, backup_x, normal_x * inv), nx)
+        ny = np.where(inside, np.where(n == 0, backup_y, normal_y * inv), ny)
+
+    return hit, nx, ny
+
+
+def ball_rects(pos, size):
+    """The integer rects of balls, truncated the same way as pygame.Rect."""
+    xy = np.trunc(pos)
+    wh = np.trunc(size)
+    centers = xy + wh // 2
+    return xy, wh, centers
+
+
+def velocities(vel):
+    """Displacement of balls during a whole tick, without the wind."""
+    conf = Config()
+    v = vel * conf.ball_speed * conf.zoom
+    slow = np.abs(v[:, 1]) < 1
+    v[slow, 1] = np.where(v[slow, 1] > 0, 1, -1)
+    return v
+
+
+def step_balls(state, balls):
+    """Move all the balls for one tick, in as many sub-steps as the fastest needs."""
+
+    if not balls:
+        return
+
+    v = velocities(np.array([tuple(b.vel) for b in balls]))
+    v[:, 0] += Config().wind_speed
+    radius = np.array([b.size.x / 2 for b in balls])
+    thickness = min((min(bricks.brick_size) for bricks in state.get_all(Bricks)), default=np.inf)
+    max_step = np.minimum(radius, thickness / 2) * MAX_STEP
+    steps = np.maximum(1, np.ceil(np.hypot(v[:, 0], v[:, 1]) / max_step)).astype(int)
+    profiler.count('ball sub-steps', int(steps.sum()))
+
+    if steps.max() == 1:
+        sub_step(state, balls, steps)
+        return
+
+    for s in range(steps.max()):
+        moving = [i for i, (ball, n) in enumerate(zip(balls, steps)) if n > s and ball.alive]
+        sub_step(state, [balls[i] for i in moving], steps[moving])
+
+
+def sub_step(state, balls, steps):
+    """Move each ball by 1/steps of its velocity and bounce on what it hits."""
+
+    if not balls:
+        return
+
+    conf = Config()
+    pos = np.array([tuple(b.pos) for b in balls])
+    vel = np.array([tuple(b.vel) for b in balls])
+    size = np.array([tuple(b.size) for b in balls])
+
+    # Integration
+    pos += velocities(vel) / steps[:, None]
+    pos[:, 0] += conf.wind_speed / steps
+
+    # Walls
+    out = pos[:, 0] < 0
+    pos[out, 0] = 0
+    vel[out, 0] *= -1
+    right = state.w - size[:, 0]
+    out = pos[:, 0] > right
+    pos[out, 0] = right[out]
+    vel[out, 0] *= -1
+    out = pos[:, 1] < 0
+    pos[out, 1] = 0
+    vel[out, 1] *= -1
+    dead = pos[:, 1] > state.h
+
+    for ball, p, v, d in zip(balls, pos.tolist(), vel.tolist(), dead.tolist()):
+        ball.pos.x, ball.pos.y = p
+        ball.vel.x, ball.vel.y = v
+        if d:
+            ball.alive = False
+
+    xy, wh, centers = ball_rects(pos, size)
+    radius = size[:, 0] / 2
+    cx = centers[:, 0]
+    cy = centers[:, 1]
+
+    # Collision with bars
+    descending = vel[:, 1] > 0
+    if descending.any():
+        for bar in state.get_all(Bar):
+            br = bar.rect
+            hit, _, _ = circle_rect_normals(cx, cy, radius, br.left, br.top, br.right, br.bottom)
+            for i in np.flatnonzero(hit & descending):
+                dx = (cx[i] - br.centerx) / br.width * 2  # proportion on the side
+                dx = clamp(dx, -0.8, 0.8)
+                angle = (-dx + 1) * 90
+                balls[i].vel.from_polar((1, -angle))
+                get_sound('bong').play()
+
+    # Collision against bricks
+    for bricks in state.get_all(Bricks):
+        pairs = []
+        rects = []
+        for i, ball in enumerate(balls):
+            swept = ball.rect.union(pygame.Rect(ball.prev_pos, ball.size))
+            for brick in bricks.bricks_in_rect(swept):
+                pairs.append((i, brick))
+                rects.append(brick.rect)
+        if not pairs:
+            continue
+
+        idx = np.array([i for i, _ in pairs])
+        r = np.array([(rect.left, rect.top, rect.right, rect.bottom) for rect in rects])
+        hit, nx, ny = circle_rect_normals(cx[idx], cy[idx], radius[idx], r[:, 0], r[:, 1], r[:, 2], r[:, 3])
+
+        for k in np.flatnonzero(hit):
+            i, brick = pairs[k]
+            if steps[i] > 1 and not brick.alive:
+                continue  # Already broken in a previous sub-step
+            ball = balls[i]
+            n = pygame.Vector2(nx[k], ny[k])
+            vel_along_normal = n.dot(ball.vel)
+            if vel_along_normal < 0:
+                continue  # Already separating
+            brick.hit(state)
+            # invert velocity along the normal
+            if brick.SOLID:
+                ball.vel -= 2 * vel_along_normal * n
+
+
+class BallPhysics(Object):
+    """Moves all the balls of the state."""
+
+    def __init__(self):
+        super().__init__((0, 0), (0, 0))
+
+    def logic(self, state):
+        step_balls(state, list(state.get_all(Ball)))
+
+    def draw(self, display):
+        pass
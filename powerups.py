@@ -6,7 +6,7 @@ from objects import Bar, BombBrick, Bricks, DoubleBrick, GlassBrick
 if TYPE_CHECKING:
     from states.game import GameState
 
-from locals import Color, Config, sprite, weighted_choice
+from locals import Color, Config, sprite, sprites, weighted_choice
 
 POWERUPS = []
 
@@ -138,9 +138,7 @@ def speed_down(game):
 def stronger_bricks(game):
     Config().brick_life += 1
     for bricks in game.get_all(Bricks):
-        for b in bricks.all_bricks():
-            if not b.SINGLE_HIT:
-                b.life += 1
+        bricks.strengthen()
 
 
 @make_powerup('Wind', 'Wooooosh', very_bad, 5, limit=1)
@@ -179,3 +177,7 @@ def invisible_wall(game):
 @make_powerup('Mirror', "You have two left hands but swapping controls won't help", very_bad, 10)
 def flip_controls(game):
     Config().flip_controls = not Config().flip_controls
+
+
+# Like in Powerup.draw()
+sprites.use({powerup.img_idx for powerup in POWERUPS}, lambda: int(Config().zoom * 4))
@@ -0,0 +1,146 @@
+"""Per-frame timing of the main loop, split by phase and by object class."""
+
+import csv
+import json
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from time import perf_counter
+
+import pygame
+import pygame.gfxdraw
+
+from locals import Color, draw_text
+
+
+class Profiler:
+    PHASES = ('events', 'logic', 'draw', 'overlay', 'update')
+    WINDOW = 60  # Number of frames averaged in the overlay
+
+    def __init__(self):
+        self.enabled = False
+        self.overlay = False
+        self.path = None  # Where to export the frames, if anywhere
+
+        self.frame = None
+        self.last_lap = 0
+        self.frames = []
+        self.recent = deque(maxlen=self.WINDOW)
+        self.counters = Counter()
+
+    def record_to(self, path):
+        """Enable the profiler and export all frames to path (.csv or .json) on save()."""
+        self.path = Path(path)
+        self.enabled = True
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.path is not None
+
+    def start_frame(self):
+        if not self.enabled:
+            return
+        self.frame = {
+            'phases': dict.fromkeys(self.PHASES, 0),
+            'logic': defaultdict(float),
+            'draw': defaultdict(float),
+            'objects': Counter(),
+            'particles': 0,
+            'counters': Counter(),
+        }
+        self.last_lap = perf_counter()
+
+    def lap(self, phase):
+        """Account the time since the last lap to the given phase."""
+        if self.frame is None:
+            return
+        now = perf_counter()
+        self.frame['phases'][phase] += now - self.last_lap
+        self.last_lap = now
+
+    def add(self, phase, obj, duration):
+        """Account the time of one object's logic or draw to its class."""
+        if self.frame is not None:
+            self.frame[phase][type(obj).__name__] += duration
+
+    def count(self, name, value=1):
+        """Increment a named counter for this frame, shown in the overlay."""
+        if self.frame is not None:
+            self.frame['counters'][name] += value
+
+    def end_frame(self, state):
+        if self.frame is None:
+            return
+        if state is not None:
+            from particles import ParticleSystem  # It imports the profiler
+            self.frame['objects'] = Counter(state.objects.counts())
+            # Not state.particles, which would create a system in states without one
+            self.frame['particles'] = sum(len(system) for system in state.get_all(ParticleSystem))
+
+        self.recent.append(self.frame)
+        if self.path is not None:
+            self.frames.append(self.frame)
+        self.frame = None
+
+    def average(self, key, name=None):
+        """Average in seconds of a phase or of a class over the recent frames."""
+        if not self.recent:
+            return 0
+        if name is None:
+            return sum(f['phases'][key] for f in self.recent) / len(self.recent)
+        return sum(f[key].get(name, 0) for f in self.recent) / len(self.recent)
+
+    def draw(self, display):
+        if not self.overlay or not self.recent:
+            return
+
+        last = self.recent[-1]
+        lines = [
+            f"{phase}: {self.average(phase) * 1000:.2f}ms"
+            for phase in self.PHASES
+        ]
+        lines.append(f"objects: {sum(last['objects'].values())}, particles: {last['particles']}")
+        classes = sorted(last['objects'], key=lambda n: -self.average('logic', n) - self.average('draw', n))
+        for name in classes:
+            lines.append(f"{name} x{last['objects'][name]}: "
+                         f"{self.average('logic', name) * 1000:.2f} + {self.average('draw', name) * 1000:.2f}ms")
+        for name, value in sorted(last['counters'].items()):
+            lines.append(f"{name}: {value}")
+
+        pygame.gfxdraw.box(display, (0, 0, display.get_width() * 0.4, 20 * len(lines) + 10), (0, 0, 0, 160))
+        y = 5
+        for line in lines:
+            y = draw_text(display, line, Color.BRIGHTEST, 16, topleft=(5, y)).bottom + 2
+
+    def rows(self):
+        """Flatten the recorded frames into dicts of milliseconds and counts."""
+        classes = sorted(set().union(*(f['objects'] for f in self.frames), *(f['logic'] for f in self.frames)))
+        counters = sorted(set().union(*(f['counters'] for f in self.frames)))
+        for i, f in enumerate(self.frames):
+            row = {'frame': i}
+            row.update({phase: f['phases'][phase] * 1000 for phase in self.PHASES})
+            row['total'] = sum(f['phases'].values()) * 1000
+            row['particles'] = f['particles']
+            for name in classes:
+                row[f'count:{name}'] = f['objects'].get(name, 0)
+                row[f'logic:{name}'] = f['logic'].get(name, 0) * 1000
+                row[f'draw:{name}'] = f['draw'].get(name, 0) * 1000
+            for name in counters:
+                row[name] = f['counters'].get(name, 0)
+            yield row
+
+    def save(self):
+        if self.path is None or not self.frames:
+            return
+
+        rows = list(self.rows())
+        if self.path.suffix == '.json':
+            self.path.write_text(json.dumps(rows))
+        else:
+            with self.path.open('w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        print(f"Saved the timings of {len(rows)} frames to {self.path}.")
+
+
+profiler = Profiler()
@@ -0,0 +1,225 @@
+"""Input of the player, that can be recorded to a file and replayed exactly.
+
+All the randomness of the game comes from the seeded session RNG and the
+player only acts through the events and the keys held of each frame. So
+the seed, the window size and, for each frame, its events and number of
+logic ticks are enough to replay a whole session.
+
+A replay file is gzipped and made of small binary records:
+ - a header with the seed and the window size,
+ - a FRAME record per frame, with its number of ticks and its events,
+ - a KEYFRAME record every KEYFRAME_TICKS ticks, with a hash of the state,
+   to detect if and where a replay stops matching the recording."""
+
+import gzip
+import struct
+from hashlib import blake2b
+
+import pygame
+
+from locals import rng, seed
+
+MAGIC = b'VRP1'
+HEADER = struct.Struct('<4sIHH')  # magic, seed, width, height
+FRAME = 0
+KEYFRAME = 1
+FRAME_RECORD = struct.Struct('<BH')  # ticks, number of events
+KEYFRAME_RECORD = struct.Struct('<I8s')  # tick, hash of the state
+
+# The events the game reacts to, with their code and fields in the file
+EVENTS = {
+    pygame.QUIT: (0, struct.Struct('<'), lambda e: ()),
+    pygame.KEYDOWN: (1, struct.Struct('<i'), lambda e: (e.key,)),
+    pygame.KEYUP: (2, struct.Struct('<i'), lambda e: (e.key,)),
+    pygame.MOUSEMOTION: (3, struct.Struct('<hh'), lambda e: e.pos),
+    pygame.MOUSEBUTTONDOWN: (4, struct.Struct('<Bhh'), lambda e: (e.button, *e.pos)),
+    pygame.VIDEORESIZE: (5, struct.Struct('<HH'), lambda e: e.size),
+}
+DECODE = {
+    0: lambda: {},
+    1: lambda key: dict(key=key),
+    2: lambda key: dict(key=key),
+    3: lambda x, y: dict(pos=(x, y)),
+    4: lambda button, x, y: dict(button=button, pos=(x, y)),
+    5: lambda w, h: dict(size=(w, h)),
+}
+TYPES = {code: (type_, fmt) for type_, (code, fmt, _) in EVENTS.items()}
+
+
+def encode_event(event):
+    code, fmt, fields = EVENTS[event.type]
+    return bytes((code,)) + fmt.pack(*fields(event))
+
+
+def read_event(file):
+    code = file.read(1)[0]
+    type_, fmt = TYPES[code]
+    return pygame.event.Event(type_, DECODE[code](*fmt.unpack(file.read(fmt.size))))
+
+
+def state_hash(state):
+    """A short hash of everything that can differ in a replay that desynced."""
+
+    h = blake2b(digest_size=8)
+    h.update(type(state).__name__.encode())
+    h.update(repr(rng.getstate()).encode())
+    for name in ('score', 'level', 'lives'):
+        h.update(repr(getattr(state, name, None)).encode())
+    for object in state.objects:
+        h.update(type(object).__name__.encode())
+        h.update(struct.pack('<dd', *object.pos))
+    return h.digest()
+
+
+class Input:
+    """The live input of the player, from pygame's events."""
+
+    size = None  # Window size the App must have, for replays
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.held = set()  # Keys currently pressed
+        self.ticks = 0  # Logic ticks since the start
+
+    def begin(self, app):
+        """Called by the app before the first state is created."""
+        self.seed = seed(self.seed)
+
+    def poll(self):
+        """The events of this frame."""
+        events = pygame.event.get()
+        self.track(events)
+        return events
+
+    def track(self, events):
+        # We follow the keys ourselves instead of pygame.key.get_pressed(),
+        # so that a replay has them too.
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                self.held.add(event.key)
+            elif event.type == pygame.KEYUP:
+                self.held.discard(event.key)
+
+    def is_pressed(self, keys):
+        return any(key in self.held for key in keys)
+
+    def logic_steps(self, steps):
+        """Number of logic ticks to run this frame, when the clock asks for steps."""
+        return steps
+
+    def end_frame(self, ticks, state):
+        self.ticks += ticks
+
+    def close(self):
+        pass
+
+
+class Recorder(Input):
+    """Live input that is also written to a replay file."""
+
+    KEYFRAME_TICKS = 300
+
+    def __init__(self, path, seed=None):
+        super().__init__(seed)
+        self.path = path
+        self.file = None
+        self.events = b''
+        self.nb_events = 0
+
+    def begin(self, app):
+        super().begin(app)
+        self.file = gzip.open(self.path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, self.seed, *map(int, app.real_size)))
+
+    def poll(self):
+        events = super().poll()
+        # Encoded now, as the app changes the events before handling them
+        recorded = [encode_event(e) for e in events if e.type in EVENTS]
+        self.events += b''.join(recorded)
+        self.nb_events += len(recorded)
+        return events
+
+    def end_frame(self, ticks, state):
+        self.file.write(bytes((FRAME,)) + FRAME_RECORD.pack(ticks, self.nb_events) + self.events)
+        self.events = b''
+        self.nb_events = 0
+
+        before = self.ticks
+        super().end_frame(ticks, state)
+        if state is not None and self.ticks // self.KEYFRAME_TICKS > before // self.KEYFRAME_TICKS:
+            self.file.write(bytes((KEYFRAME,)) + KEYFRAME_RECORD.pack(self.ticks, state_hash(state)))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            print(f"Recorded {self.ticks} ticks with seed {self.seed} to {self.path}.")
+
+
+class Replay(Input):
+    """Input read from a replay file. The app stops at the end of the file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'rb')
+        magic, recorded_seed, w, h = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a replay file.")
+
+        super().__init__(recorded_seed)
+        self.size = (w, h)
+        self.steps = 0  # Ticks to run in the current frame
+        self.next = None  # Next frame: (ticks, events), None at the end
+        self.keyframes = 0  # Number of keyframes checked
+        self.desync = None  # First tick where the state differs from the recording
+
+    def begin(self, app):
+        super().begin(app)
+        self.next = self.read(None)
+
+    def read(self, state):
+        """Read the next frame, checking the keyframes before it against state."""
+        try:
+            while True:
+                tag = self.file.read(1)
+                if not tag:
+                    return None
+                if tag[0] == KEYFRAME:
+                    tick, digest = KEYFRAME_RECORD.unpack(self.file.read(KEYFRAME_RECORD.size))
+                    self.check(tick, digest, state)
+                else:
+                    ticks, nb = FRAME_RECORD.unpack(self.file.read(FRAME_RECORD.size))
+                    return ticks, [read_event(self.file) for _ in range(nb)]
+        except (EOFError, IndexError, struct.error):
+            # The recording was cut, e.g. the game crashed
+            return None
+
+    def check(self, tick, digest, state):
+        self.keyframes += 1
+        if self.desync is None and (tick != self.ticks or state is None or digest != state_hash(state)):
+            self.desync = self.ticks
+            print(f"Replay desynced from the recording at tick {self.ticks}.")
+
+    def poll(self):
+        # The player can still quit or look at the profiler
+        live = [e for e in pygame.event.get()
+                if e.type == pygame.QUIT or e.type == pygame.KEYDOWN and e.key in (pygame.K_ESCAPE, pygame.K_F3)]
+
+        if self.next is None:
+            self.steps = 0
+            return live + [pygame.event.Event(pygame.QUIT)]
+
+        self.steps, events = self.next
+        self.track(events)
+        return events + live
+
+    def logic_steps(self, steps):
+        return self.steps
+
+    def end_frame(self, ticks, state):
+        super().end_frame(ticks, state)
+        self.next = self.read(state)
+
+    def close(self):
+        self.file.close()
+        status = "in sync" if self.desync is None else f"desynced at tick {self.desync}"
+        print(f"Replayed {self.ticks} ticks of {self.path}, {self.keyframes} keyframes checked, {status}.")
@@ -5,6 +5,7 @@ let
   customPython = pkgs.python38.buildEnv.override {
     extraLibs = with pkgs.python38Packages; [
       pygame
+      numpy
     ];
   };
 in
@@ -1,23 +1,21 @@
-from random import random
-
 import pygame
 
 from core import DEBUG, State
-from locals import Color, Config, get_level_surf, settings
-from objects import BackgroundShape, Ball, Bar, Bricks, Particle
+from locals import Color, Config, get_level_surf, rng, settings
+from objects import BackgroundShape, Ball, Bar, Bricks
+from physics import BallPhysics
 from powerups import brick, god_like, very_bad
 from states.gameover import GameOverState
 from states.pause import PauseState
 from states.pickpowerup import PickPowerUpState
 
-pygame.init()
-
 
 class GameState(State):
     BG_COLOR = Color.DARKEST
     BG_MUSIC = 'ambience.wav'
     BG_SHAPES = 10
     BALL_SPEED_GAIN = 0.2
+    DIRTY_RECTS = True
 
     def __init__(self):
         super().__init__()
@@ -34,6 +32,8 @@ class GameState(State):
 
         self.bar = self.add(Bar(self.h - 30))
         self.bricks = self.add(Bricks.load(0))
+        # Before the balls, so they move at the same time in the logic as before
+        self.ball_physics = self.add(BallPhysics())
         self.add(self.bar.spawn_ball())
 
         for _ in range(self.BG_SHAPES):
@@ -69,7 +69,7 @@ class GameState(State):
         config.ball_speed += 1 / 60 / 60  # one pixel per second
 
         # No more balls, spawn one, loose life
-        if not list(self.get_all(Ball)):
+        if not self.count(Ball):
             self.add(self.bar.spawn_ball())
             self.loose_life()
 
@@ -78,8 +78,8 @@ class GameState(State):
 
         if config.wind:
             speed = config.wind_speed
-            if speed and random() < abs(speed) / 3 / 10:
-                self.add(Particle.wind_particle())
+            if speed and rng.random() < abs(speed) / 3 / 10:
+                self.particles.wind_particle()
 
         if config.spawn_ball():
             self.add(self.bar.spawn_ball())
@@ -91,6 +91,8 @@ class GameState(State):
             self.next_state = GameOverState(self.level, self.score, self.powerups)
 
     def draw(self, display):
+        # The text changes, so its line is always redrawn
+        self.mark_dirty((0, 0, self.w, Config().iscale(32) + 6))
         super(GameState, self).draw(display)
 
         self.draw_text(display, f"Score: {self.score}", topright=(self.w - 5, 3))
@@ -1,10 +1,8 @@
-from random import gauss, uniform
-
 import pygame
 
 from core import State
-from locals import Color, polar
-from objects import Bar, Particle
+from locals import Color
+from objects import Bar
 from powerups import POWERUPS, random_powerup
 from states.game import GameState
 from states.pickpowerup import PickPowerUpState
@@ -28,12 +26,7 @@ class IntroState(State):
 
         if self.timer == 60 * 4:
             self.text = "Press SPACE to start"
-            for _ in range(20):
-                self.add(Particle(
-                    self.size / 2,
-                    polar(gauss(15, 2), uniform(0, 360)),
-                    20
-                ))
+            self.particles.burst(self.size / 2, 20, 15, 2, 20)
 
         if self.ended:
             self.next_state = PickPowerUpState(GameState())
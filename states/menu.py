@@ -1,14 +1,26 @@
+from importlib import import_module
 from math import ceil, pi, sin
-from random import random, uniform
 
 import pygame
 import pygame.gfxdraw
 
+from assets import assets
 from core import State
 from locals import Color, Config, config, get_text, rrange
-from objects import BackgroundShape, Particle
-from states.game import GameState
-from states.statistics import StatisticsState
+from objects import BackgroundShape
+
+
+def lazy(path):
+    """A state that is only imported when first created, like 'states.game.GameState'.
+
+    This way the menu shows up before the rest of the game is loaded,
+    which the asset loader does in the background."""
+    module, _, name = path.rpartition('.')
+
+    def create():
+        return getattr(import_module(module), name)()
+
+    return create
 
 
 class MenuState(State):
@@ -17,10 +29,10 @@ class MenuState(State):
 
         self.timer = 0
         self.buttons = {
-            "Play": GameState,
+            "Play": lazy('states.game.GameState'),
             "Settings": MenuState,
             "Highscores": MenuState,
-            "Statistics": StatisticsState,
+            "Statistics": lazy('states.statistics.StatisticsState'),
             "Quit": None
         }
         self.selected = 0
@@ -48,6 +60,7 @@ class MenuState(State):
 
     def logic(self):
         super().logic()
+        assets.update()
 
         self.timer += 1
 
@@ -55,8 +68,7 @@ class MenuState(State):
         if self.timer == 1:
             return
 
-        for _ in rrange(min(3, self.timer / 100)):
-            self.add(Particle.from_edges(self.play_button_center))
+        self.particles.from_edges(self.play_button_center, len(rrange(min(3, self.timer / 100))))
 
     def draw(self, display):
         super().draw(display)
@@ -1,13 +1,11 @@
 from math import ceil, sin
-from random import random, uniform
 
 import pygame
 import pygame.gfxdraw
 
 from core import State
 from locals import Color, Config, config, get_text, rrange, settings
-from objects import BackgroundShape, Particle
-from states.game import GameState
+from objects import BackgroundShape
 
 
 class StatisticsState(State):
@@ -45,8 +43,7 @@ class StatisticsState(State):
         if self.timer == 1:
             return
 
-        for _ in rrange(min(3, self.timer / 100)):
-            self.add(Particle.from_edges(self.size / 2))
+        self.particles.from_edges(self.size / 2, len(rrange(min(3, self.timer / 100))))
 
     def draw(self, display):
         super().draw(display)
@@ -0,0 +1,34 @@
+"""Timeline of the startup of the game, printed with --timeline.
+
+This module has no dependency so that it can be imported first and
+measure the import of everything else."""
+
+from time import perf_counter
+
+
+class Timeline:
+    def __init__(self):
+        self.enabled = False
+        self.start = perf_counter()
+        self.last = self.start  # Time of the last mark reported
+        self.marks = []  # (name, time)  # Not reported yet
+
+    def mark(self, name):
+        """Note that the step name of the startup just finished."""
+        if self.enabled:
+            self.marks.append((name, perf_counter()))
+
+    def report(self):
+        """Print the marks since the last report."""
+        if not self.enabled or not self.marks:
+            return
+
+        if self.last == self.start:
+            print("Startup timeline:")
+        for name, time in self.marks:
+            print(f"{(time - self.start) * 1000:8.1f}ms {(time - self.last) * 1000:+8.1f}ms  {name}")
+            self.last = time
+        self.marks = []
+
+
+timeline = Timeline()
@@ -1,8 +1,100 @@
-from core import App
-from states.menu import MenuState
+# First, to measure the import of everything else
+from timeline import timeline
+
+import os
+from argparse import ArgumentParser
+
+
+def main():
+    parser = ArgumentParser(description="Not a Brick Breaker")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run the game logic without a window, as fast as possible.")
+    parser.add_argument('--frames', type=int,
+                        help="Number of logic ticks to simulate in headless mode. "
+                             "Defaults to one minute, or the whole replay.")
+    parser.add_argument('--render-every', type=int, default=0, metavar='K',
+                        help="Draw every K ticks in headless mode, 0 to never draw.")
+    parser.add_argument('--no-autopilot', action='store_true',
+                        help="Do not play automatically in headless mode.")
+    parser.add_argument('--dirty-rects', action='store_true',
+                        help="Only update the parts of the screen that changed.")
+    parser.add_argument('--balls', type=int, default=0, metavar='N',
+                        help="Start a headless game with N balls, to stress the physics.")
+    parser.add_argument('--max-particles', type=int, metavar='N',
+                        help="Maximum number of particles alive at the same time.")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="Record the timing of each frame to a .csv or .json file. "
+                             "Press F3 in game to show them.")
+    parser.add_argument('--seed', type=int,
+                        help="Seed of the randomness of the game, random by default.")
+    parser.add_argument('--record', metavar='FILE',
+                        help="Record the input of the session to FILE, to replay it later.")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="Replay a session recorded with --record.")
+    parser.add_argument('--levels', metavar='PACK',
+                        help="Play the levels of a level pack made with levelpack.py. "
+                             "Replays need the same pack.")
+    parser.add_argument('--timeline', action='store_true',
+                        help="Print how long each step of the startup took.")
+    args = parser.parse_args()
+    timeline.enabled = args.timeline
+
+    if args.record and args.headless:
+        parser.error("--record needs a player, it cannot be used with --headless.")
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together.")
+
+    if args.headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
 
-if __name__ == '__main__':
     import pygame
+    timeline.mark('import pygame')
     print(pygame.init())
+    timeline.mark('pygame.init')
+
+    if args.levels:
+        import levels
+        try:
+            levels.use(args.levels)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
 
-    App(MenuState).run()
+    if args.max_particles is not None:
+        from particles import budget
+        budget.cap = args.max_particles
+
+    if args.profile:
+        from profiler import profiler
+        profiler.record_to(args.profile)
+
+    from replay import Input, Recorder, Replay
+    if args.replay:
+        inputs = Replay(args.replay)
+    elif args.record:
+        inputs = Recorder(args.record, args.seed)
+    else:
+        inputs = Input(args.seed)
+
+    if args.headless and args.replay:
+        from headless import run_headless
+        from states.menu import MenuState
+        run_headless(args.frames or float('inf'), args.render_every, False, MenuState, inputs=inputs)
+    elif args.headless:
+        from headless import run_headless
+        run_headless(args.frames or 60 * 60, args.render_every, not args.no_autopilot,
+                     balls=args.balls, inputs=inputs)
+    else:
+        from assets import assets
+        from core import App
+        from states.menu import MenuState
+        timeline.mark('import the game')
+        App.DIRTY_RECTS = args.dirty_rects
+        app = App(MenuState, inputs=inputs)
+        # While the menu is shown, it converts them once they are loaded
+        assets.start()
+        app.run()
+
+
+if __name__ == '__main__':
+    main()